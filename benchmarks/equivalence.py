@@ -0,0 +1,188 @@
+import argparse
+import math
+import os
+import random
+import sys
+import tempfile
+
+import numpy as np
+
+from seq import StepSequence, euc
+from seq.euc import bjorklund
+from midi import MidiWriter, MidoMidiWriter, StreamingMidiWriter
+from midi.midiwriter import MidiFile
+from seqmorph import (SimpleProbStepAlg, SimpleProbStepAlgV2, MegaMorphV1, DirectMorph100, DirectMorph50,
+                      TestingNoRandom)
+
+# Equivalence checks of the vectorized pipeline against straightforward reference implementations.
+# Run from the repository root, exits with status 1 on any mismatch:
+#   python -m benchmarks.equivalence
+
+
+# Per-step rules of the original loop implementations, given the (s, e) marks of a step and its neighbours
+
+
+def simple(cur, prev, nxt, rp):
+    if any(cur):
+        return 1 - rp/2
+    if any(prev) or any(nxt):
+        return rp/2
+    return 0.0
+
+
+def simple_v2(cur, prev, nxt, rp):
+    if any(cur):
+        return 1 - rp/4 if cur[0] else 1 - rp/2
+    if any(prev) or any(nxt):
+        return rp/4 if prev[0] or nxt[0] else rp/2
+    return 0.0
+
+
+def mega_morph_v1(cur, prev, nxt, rp):
+    if not any(cur):
+        if all(prev) or all(nxt):
+            return rp/4
+        if prev[0] or nxt[0]:
+            return rp/2
+        return 0.0
+    if all(cur):
+        return 1 - rp/4
+    if cur[0]:
+        return 1 - rp/2
+    return rp
+
+
+def direct_morph_100(cur, prev, nxt, rp):
+    if all(cur):
+        return max(1 - rp, rp)
+    if cur[0]:
+        return 1 - rp
+    if cur[1]:
+        return rp
+    return 0.0
+
+
+def direct_morph_50(cur, prev, nxt, rp):
+    if cur[0]:
+        return 1 - (rp/2)
+    if cur[1]:
+        return rp/2
+    return 0.0
+
+
+def testing_no_random(cur, prev, nxt, rp):
+    return 1.00 if any(cur) else 0.00
+
+
+REFERENCES = [(SimpleProbStepAlg(), simple), (SimpleProbStepAlgV2(), simple_v2), (MegaMorphV1(), mega_morph_v1),
+              (DirectMorph100(), direct_morph_100), (DirectMorph50(), direct_morph_50),
+              (TestingNoRandom(), testing_no_random)]
+
+
+def reference_prob_steps(s: list[bool], e: list[bool], r: int, rule) -> tuple[list[float], list[tuple]]:
+    rp = np.clip(r/100, 0, 1)
+    data = [(seq, bit) for seq, bit in ((s, 0), (e, 1)) if any(seq)]
+    length = math.lcm(*[len(seq) for seq, _ in data])
+    marks = []
+    for i in range(length):
+        mark = [False, False]
+        for seq, bit in data:
+            if seq[i % len(seq)]:
+                mark[bit] = True
+        marks.append(tuple(mark))
+    return [rule(marks[i], marks[i - 1], marks[(i + 1) % length], rp) for i in range(length)], marks
+
+
+def check_prob_steps(trials: int, rnd: random.Random) -> int:
+    failures = 0
+    for _ in range(trials):
+        s = [rnd.random() < 0.3 for _ in range(rnd.randint(1, 24))]
+        e = [rnd.random() < 0.4 for _ in range(rnd.randint(1, 24))]
+        if not any(s) and not any(e):
+            continue
+        r = rnd.choice([0, 25, 33, 50, 66, 100, rnd.randint(-20, 120)])
+        for alg, rule in REFERENCES:
+            expected, marks = reference_prob_steps(s, e, r, rule)
+            result = alg.generate_prob_steps(StepSequence().init_from_list(s), StepSequence().init_from_list(e), r)
+            props = [(bool(p & 1), bool(p & 2)) for p in result.properties.tolist()]
+            if result.probability.tolist() != expected or props != marks:
+                print('prob_steps mismatch: ' + type(alg).__name__, s, e, r)
+                failures += 1
+    return failures
+
+
+def check_euc(trials: int, rnd: random.Random) -> int:
+    # Every pattern up to 64 steps against the original Bjorklund implementation
+    failures = 0
+    for n in range(1, 65):
+        for k in range(n + 1):
+            for r in range(n):
+                if list(euc(k, n, r)) != bjorklund(k, n, r):
+                    print('euc mismatch:', k, n, r)
+                    failures += 1
+    return failures
+
+
+def random_sequences(rnd: random.Random) -> list[StepSequence]:
+    sequences = []
+    for _ in range(rnd.randint(1, 5)):
+        length = rnd.randint(0, 40)
+        onsets = [rnd.random() < 0.3 for _ in range(length)]
+        velocities = [rnd.randint(1, 127) for _ in range(length)]
+        offsets = [rnd.uniform(-0.5, 0.5) if rnd.random() < 0.3 else 0.0 for _ in range(length)]
+        sequences.append(StepSequence(tempo=rnd.choice([120, 120, 90]), subdivision=rnd.choice([4, 4, 3]),
+                                      note=rnd.randint(36, 50))
+                         .init_from_arrays(onsets, velocities, offsets))
+    return sequences
+
+
+def check_midi(trials: int, rnd: random.Random) -> int:
+    # The direct SMF encoder against the mido path, and the streaming writer against both
+    if MidiFile is None:
+        print('midi: mido is not installed, comparing MidiWriter with StreamingMidiWriter only')
+    failures = 0
+    path = os.path.join(tempfile.gettempdir(), 'equivalence.mid')
+    for _ in range(trials):
+        sequences = random_sequences(rnd)
+        writer = MidiWriter()
+        for s in sequences:
+            writer.add(s)
+        expected = writer.to_bytes()
+        with StreamingMidiWriter(path) as streaming:
+            streaming.add_all(sequences)
+        with open(path, 'rb') as f:
+            outputs = {'StreamingMidiWriter': f.read()}
+        if MidiFile is not None:
+            mido_writer = MidoMidiWriter()
+            for s in sequences:
+                mido_writer.add(s)
+            mido_writer.save(path)
+            with open(path, 'rb') as f:
+                outputs['MidoMidiWriter'] = f.read()
+        for name, data in outputs.items():
+            if data != expected:
+                print('midi mismatch: ' + name, [s.rhythm_notation() for s in sequences])
+                failures += 1
+    os.remove(path)
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.equivalence',
+                                     description='Check the vectorized pipeline against reference implementations.')
+    parser.add_argument('--trials', type=int, default=300, help='random cases per check')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rnd = random.Random(args.seed)
+    failures = 0
+    for name, check in (('prob_steps', check_prob_steps), ('euc', check_euc), ('midi', check_midi)):
+        count = check(args.trials, rnd)
+        print(f'{name:<20}' + ('ok' if not count else str(count) + ' mismatches'))
+        failures += count
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+
+from seq import StepSequence, euc
+from seq.euc import bjorklund, euclid_words
+from seqmorph import automation, EucMorpher, DirectMorph50, prob_steps_cache, morphers, evaluate_all
+from midi import MidiWriter
+
+# Offline benchmark suite for the hot paths of the morph pipeline.
+# Run from the repository root:
+#   python -m benchmarks.run -o before.json
+#   python -m benchmarks.run -o after.json --compare before.json
+# Each case reports the best and mean time of one call over several repeats.
+
+CASES = {}
+
+
+def case(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def random_sequence(length: int, seed: int = 0, density: float = 0.3) -> StepSequence:
+    rng = np.random.default_rng(seed)
+    return StepSequence().init_from_list(rng.random(length) < density)
+
+
+for n in (16, 128, 1024, 4096):
+    case(f'euc/bjorklund/n={n}')(lambda n=n: lambda: bjorklund(n // 3, n, 1))
+    case(f'euc/euclid_words/n={n}')(lambda n=n: lambda: euclid_words(n // 3, n))
+
+# Co-prime lengths give the worst case hyperperiod, the LCM is the product of the lengths
+for ls, le in ((31, 32), (127, 128), (257, 256)):
+    for name, alg in {**morphers(), 'DirectMorph50': DirectMorph50()}.items():
+        def setup(ls=ls, le=le, alg=alg):
+            s = random_sequence(ls)
+            e = StepSequence().init_from_list(euc(le // 3, le, 0))
+            return lambda: alg.generate_prob_steps(s, e, 50)
+        case(f'prob_steps/{name}/lcm={ls}x{le}')(setup)
+
+    def setup_all(ls=ls, le=le):
+        s = random_sequence(ls)
+        e = StepSequence().init_from_list(euc(le // 3, le, 0))
+        return lambda: evaluate_all(s, e, 50)
+    case(f'prob_steps/evaluate_all/lcm={ls}x{le}')(setup_all)
+
+
+def morpher():
+    prob_steps_cache.clear()
+    return EucMorpher(random_sequence(16), 5, 16, 0, 50, morphers()['MegaMorphV1'], seed=0)
+
+
+for bars in (1, 100, 10000):
+    case(f'morpher/generate/bars={bars}')(lambda bars=bars: lambda m=morpher(): m.generate(bars))
+case('morpher/generate_many/bars=16,variations=1000')(lambda: lambda m=morpher(): m.generate_many(16, 1000))
+case('morpher/generate_automated/bars=10000')(
+    lambda: lambda m=morpher(): m.generate_automated(automation.linear(0, 100, 10000)))
+
+for bars in (100, 10000):
+    def setup_add(bars=bars):
+        v = morpher().generate(bars)
+        return lambda: MidiWriter().add(v)
+    case(f'midi/add/bars={bars}')(setup_add)
+
+    def setup_save(bars=bars):
+        mw = MidiWriter()
+        mw.add(morpher().generate(bars))
+        path = os.path.join(tempfile.gettempdir(), 'benchmark.mid')
+        return lambda: mw.save(path)
+    case(f'midi/save/bars={bars}')(setup_save)
+
+
+def measure(fn, repeat: int, min_time: float) -> dict:
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    times = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {'best': min(times), 'mean': sum(times) / len(times), 'number': number, 'repeat': repeat}
+
+
+def commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> int:
+    regressions = 0
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        ratio = result['best'] / baseline[name]['best']
+        flag = ''
+        if ratio > threshold:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f'{name:<55}{ratio:8.2f}x{flag}')
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.run', description='Run the benchmark suite.')
+    parser.add_argument('-o', '--out', default='benchmark.json', help='JSON file to record results to')
+    parser.add_argument('-k', '--filter', default='', help='only run cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds per repeat (approximately)')
+    parser.add_argument('--compare', help='earlier results to compare against')
+    parser.add_argument('--threshold', type=float, default=1.2, help='slowdown ratio reported as a regression')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, setup in CASES.items():
+        if args.filter not in name:
+            continue
+        results[name] = measure(setup(), args.repeat, args.min_time)
+        print(f'{name:<55}{results[name]["best"] * 1e3:12.4f} ms')
+
+    with open(args.out, 'w') as f:
+        json.dump({'commit': commit(), 'python': platform.python_version(), 'numpy': np.__version__,
+                   'platform': platform.platform(), 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print('\nCompared to ' + args.compare)
+        if compare(results, baseline, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
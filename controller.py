@@ -1,70 +1,141 @@
-import gui
-from midi.midiwriter import MidiWriter
-from seqmorph import (EucMorpher, SimpleProbStepAlg, SimpleProbStepAlgV2,
-                      DirectMorph100, DirectMorph50, MegaMorphV1, TestingNoRandom, ProbStep)
-from seq import StepSequence
+import queue
+import threading
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING
+
+from seqmorph import ProbStep, PeriodicProbSteps, Session, GenerateParams
+from seqmorph.session import CHUNK_STEPS
+
+if TYPE_CHECKING:
+    import gui
+
+
+@dataclass
+class Job:
+    kind: str
+    params: GenerateParams = None
+    log: str = 'off'
+    path: str = None
+    repeat: int = 1
 
 
 class Controller:
+    # Generation and saving run in order on a worker thread. The view snapshots its variables on the
+    # main thread, and picks up progress and results from poll().
     def __init__(self, view):
-        self.view: gui.GUI = view
-        self.mw: MidiWriter = MidiWriter()
-        self._oldEucParams = (-1, -1, -1)
-        self._oldSeq = None
-        self._pos = 0
-        self.morphers = {
-            "DirectMorph100": DirectMorph100(),
-            "MegaMorphV1": MegaMorphV1(),
-            "SimpleProbStepAlg": SimpleProbStepAlg(),
-            "SimpleProbStepAlgV2": SimpleProbStepAlgV2(),
-            "TestingNoRandom": TestingNoRandom()
-        }
+        self.view: 'gui.GUI' = view
+        self.session = Session()
+        self.morphers = self.session.morphers
+        self._jobs: list[Job] = []
+        self._jobs_ready = threading.Condition()
+        self._cancel = threading.Event()
+        self._results = queue.Queue()
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def params(self) -> GenerateParams:
+        return GenerateParams(sequence=self.view.sequence.get(), onsets=self.view.onsets.get(),
+                              length=self.view.length.get(), rotation=self.view.rotation.get(),
+                              amount=self.view.amount.get(), algorithm=self.view.morpher.get(),
+                              note=self.view.note.get(), tempo=self.view.tempo.get(),
+                              subdivision=self.view.subdivisions.get(), bars=self.view.num_bars.get())
+
+    def _submit(self, job: Job):
+        with self._jobs_ready:
+            last = self._jobs[-1] if self._jobs else None
+            # Repeated GENERATE clicks with the same settings are merged into one job
+            if (job.kind == 'generate' and last is not None and last.kind == 'generate'
+                    and (last.params, last.log) == (job.params, job.log)):
+                last.repeat += 1
+            else:
+                self._jobs.append(job)
+            self._jobs_ready.notify()
 
     def handle_generate(self):
-        k = self.view.onsets.get()
-        n = self.view.length.get()
-        r = self.view.rotation.get()
-        a = self.view.amount.get()
-        morpher = self.morphers[self.view.morpher.get()]
-        note = self.view.note.get()
+        self._submit(Job('generate', self.params(), self.view.log_option.get()))
 
-        tempo = self.view.tempo.get()
-        subdivisions = self.view.subdivisions.get()
+    def handle_save(self, filename):
+        self._submit(Job('save', log=self.view.log_option.get(), path=filename))
 
-        seq = self.view.sequence.get()
-        num = self.view.num_bars.get()
+    def handle_clear(self):
+        self._submit(Job('clear'))
 
-        s = StepSequence(tempo=tempo, subdivision=subdivisions, note=note).init_from_list(list(int(x) for x in seq))
-        m = EucMorpher(s, k, n, r, a, morpher)
+    def handle_cancel(self):
+        with self._jobs_ready:
+            self._jobs = [job for job in self._jobs if not job.kind == 'generate']
+        self._cancel.set()
 
-        if self._oldEucParams != (k, n, r) or not s.is_same_rhythm(self._oldSeq):
-            self._pos = 0
+    def poll(self) -> list[tuple]:
+        # Results posted by the worker since the last call: ('progress', done, total) or ('done', message)
+        results = []
+        while not self._results.empty():
+            results.append(self._results.get_nowait())
+        return results
 
-        start_pos = self._pos
+    def _work(self):
+        while True:
+            with self._jobs_ready:
+                while not self._jobs:
+                    self._jobs_ready.wait()
+                job = self._jobs.pop(0)
+                self._cancel.clear()
+            try:
+                if job.kind == 'generate':
+                    message = self._generate(job)
+                elif job.kind == 'save':
+                    if job.log == "print all":
+                        self.session.mw.print()
+                    self.session.save(job.path)
+                    message = 'Saved and cleared MIDI'
+                else:
+                    self.session.clear()
+                    message = 'Cleared MIDI file'
+            except Exception as e:
+                message = 'Error: ' + str(e)
+            self._results.put(('done', message))
 
-        v = m.generate(num, self._pos)
-        self._pos = (self._pos + v.length()) % len(m.prob_steps())
+    def _generate(self, job: Job) -> str:
+        bars = job.params.bars
+        # Hyperperiods (bars=0) are generated bar by bar like other jobs, in chunks of about CHUNK_STEPS steps
+        total = (self.session.bars_per_period(job.params) if bars <= 0 else bars) * job.repeat
+        chunk_bars = max(1, CHUNK_STEPS // max(1, len(job.params.sequence)))
+        chunks = [chunk_bars] * (total // chunk_bars)
+        if total % chunk_bars:
+            chunks.append(total % chunk_bars)
 
-        self.mw.add(v)
+        parts = []
+        start_pos = self.session.position()
+        for i, chunk in enumerate(chunks):
+            if self._cancel.is_set():
+                return 'Cancelled after ' + str(sum(chunks[:i])) + ' bars'
+            v = self.session.generate(replace(job.params, bars=chunk))
+            # Generated bars are only kept when the log prints them
+            if job.log in ('print rhythm', 'print all'):
+                parts.append(v)
+            self._results.put(('progress', i + 1, len(chunks)))
+        if not chunks:
+            return 'Generated 0 bars!'
 
-        self._oldEucParams = (k, n, r)
-        self._oldSeq = s
+        self.log(job.log, parts, start_pos)
+        if bars <= 0:
+            return 'Generated HYPERPERIOD of bars!' if job.repeat == 1 else \
+                'Generated ' + str(job.repeat) + ' HYPERPERIODS of bars!'
+        return 'Generated ' + str(bars * job.repeat) + ' bars!'
 
-        if self.view.log_option.get() == "print all":
-            print(ProbStep.str_list(m.prob_steps()) + '\n')
+    def log(self, log_option, parts, start_pos):
+        if log_option == "print all":
+            prob_steps = self.session.morpher.prob_steps()
+            if isinstance(prob_steps, PeriodicProbSteps):
+                # Hyperperiods above MAX_PERIOD are computed on demand and too long to print
+                print('PROBABILITY STEPS\nlength: ' + str(len(prob_steps)) + ' (not printed)\n')
+            else:
+                print(ProbStep.str_list(prob_steps) + '\n')
             print("GENERATED FROM: " + str(start_pos))
-            print("GENERATED TO: " + str(self._pos) + '\n')
+            print("GENERATED TO: " + str(self.session.position()) + '\n')
 
-        if self.view.log_option.get() == "print rhythm" or self.view.log_option.get() == "print all":
+        if log_option == "print rhythm" or log_option == "print all":
+            v = parts[0]
+            for part in parts[1:]:
+                v = v + part
             print('---RESULTING RHYTHM---')
             print(v.seq_string())
             print('\n')
-
-    def handle_save(self, filename):
-        if self.view.log_option.get() == "print all":
-            self.mw.print()
-        self.mw.save(filename)
-        self.mw = MidiWriter()
-
-    def handle_clear(self):
-        self.mw = MidiWriter()
@@ -1,16 +1,18 @@
 import tkinter as tk
 from tkinter import font
 from tkinter import filedialog
+from tkinter import ttk
 
 import controller as ctr
 from seq import euc
+from seqmorph.preview import preview_prob_steps, probability_string
 
 
 class GUI:
     def __init__(self):
         self.controller = ctr.Controller(self)
         self.root = tk.Tk()
-        self.root.geometry('525x400')
+        self.root.geometry('525x435')
         self.root.title('Euclidean Morpher Prototype')
         self.root.configure(background='gray77')
 
@@ -28,6 +30,8 @@ class GUI:
         temp = euc(self.onsets.get(), self.length.get(), self.rotation.get())
         temp = ''.join(str(x) for x in temp)
         self.euc.set(temp)
+        self.preview = tk.StringVar()
+        self._preview_job = None
 
         # Sequencer variables
         self.sequence = tk.StringVar()
@@ -61,6 +65,11 @@ class GUI:
         self.add_options()
         self.add_filechooser()
         self.add_generator()
+        self.root.after(50, self.poll)
+
+        for var in (self.sequence, self.amount, self.morpher):
+            var.trace_add('write', lambda *args: self.schedule_preview())
+        self.update_preview()
 
         # TODO: Extra stuff like "restart" or "clear" and info, credit and stuff
 
@@ -97,6 +106,22 @@ class GUI:
         temp = euc(self.onsets.get(), self.length.get(), self.rotation.get())
         temp = ''.join(str(x) for x in temp)
         self.euc.set(temp)
+        self.schedule_preview()
+
+    def schedule_preview(self):
+        # Debounces input, the preview is rebuilt once the input has been still for 150 ms
+        if self._preview_job is not None:
+            self.root.after_cancel(self._preview_job)
+        self._preview_job = self.root.after(150, self.update_preview)
+
+    def update_preview(self):
+        self._preview_job = None
+        try:
+            p = preview_prob_steps(self.sequence.get(), self.onsets.get(), self.length.get(), self.rotation.get(),
+                                   self.amount.get(), self.controller.morphers[self.morpher.get()])
+        except tk.TclError:
+            p = None
+        self.preview.set('' if p is None else probability_string(p))
 
     def add_euc(self):
         eucframe = tk.Frame(self.root, bd=3, bg='pink1')
@@ -104,6 +129,12 @@ class GUI:
         tk.Label(eucframe, text='EUCLIDEAN', bd=3, relief=tk.SUNKEN).pack(side=tk.LEFT)
         tk.Entry(eucframe, width=32, font=('Arial', 16), fg='gray26', textvariable=self.euc, state='readonly').pack(side=tk.RIGHT)
 
+        previewframe = tk.Frame(self.root, bd=3, bg='pink1')
+        previewframe.pack(side=tk.TOP, anchor=tk.E)
+        tk.Label(previewframe, text='PREVIEW', bd=3, relief=tk.SUNKEN).pack(side=tk.LEFT)
+        tk.Entry(previewframe, width=32, font=('Arial', 16), fg='gray26', textvariable=self.preview,
+                 state='readonly').pack(side=tk.RIGHT)
+
     def add_sequencer(self):
         # SEQUENCER FRAME
         seqframe = tk.Frame(self.root, bd=3, bg='skyblue1')
@@ -157,13 +188,26 @@ class GUI:
                                 textvariable=self.num_bars, font=self.default_font)
         numbarsbox.grid(row=0, column=2, sticky='news', rowspan=2)
 
+        self.progress = ttk.Progressbar(generatorframe, length=80, mode='determinate')
+        self.progress.grid(row=0, column=3, sticky='ew')
+        (tk.Button(generatorframe, text='cancel', font=("TkDefaultFont", 8), command=self.controller.handle_cancel)
+         .grid(row=1, column=3, sticky='news'))
+
     def generate(self):
         self.controller.handle_generate()
-        if self.num_bars.get() == 0:
-            info = "Generated HYPERPERIOD of bars!"
-        else:
-            info = "Generated " + str(self.num_bars.get()) + " bars!"
-        infolabel = tk.Label(self.root, text=info)
+
+    def poll(self):
+        # Picks up progress and results from the controller's worker thread
+        for result in self.controller.poll():
+            if result[0] == 'progress':
+                self.progress['value'] = 100 * result[1] / result[2]
+            else:
+                self.progress['value'] = 0
+                self.info(result[1])
+        self.root.after(50, self.poll)
+
+    def info(self, text):
+        infolabel = tk.Label(self.root, text=text)
         infolabel.pack(side=tk.TOP)
         infolabel.after(2000, lambda: infolabel.destroy())
 
@@ -177,15 +221,9 @@ class GUI:
         path = filedialog.asksaveasfilename(defaultextension='.mid', filetypes=[('.mid', '*.mid')])
         if path:
             self.controller.handle_save(path)
-            infolabel = tk.Label(self.root, text="Saved and cleared MIDI")
-            infolabel.pack(side=tk.TOP)
-            infolabel.after(2000, lambda: infolabel.destroy())
 
     def clear_file(self):
         self.controller.handle_clear()
-        infolabel = tk.Label(self.root, text='Cleared MIDI file')
-        infolabel.pack(side=tk.TOP)
-        infolabel.after(2000, lambda: infolabel.destroy())
 
     def run(self):
         self.root.mainloop()
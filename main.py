@@ -1,11 +1,19 @@
+import os
+
 from controller import Controller
 from midi.midiwriter import MidiWriter
 from seqmorph import (EucMorpher, SimpleProbStepAlg, SimpleProbStepAlgV2,
                       DirectMorph100, DirectMorph50, MegaMorphV1, ProbStep)
-from seq import StepSequence
+from seq import StepSequence, use_euc_table
+from seq.table import load_euc_table
 import gui
 
+# Built with: python -m seq.table euc_table.npy
+EUC_TABLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'euc_table.npy')
+
 if __name__ == '__main__':
+    if os.path.exists(EUC_TABLE):
+        use_euc_table(load_euc_table(EUC_TABLE))
     app = gui.GUI()
     app.run()
     
\ No newline at end of file
@@ -1 +1,2 @@
-from .midiwriter import MidiWriter
+from .midiwriter import MidiWriter, MultiTrackMidiWriter, StreamingMidiWriter, MidoMidiWriter
+from .live import LivePlayer, LiveMetrics, PortSink, FileSink
@@ -0,0 +1,169 @@
+import threading
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from seq import StepSequence
+from .smf import NOTE_ON, NOTE_OFF, NOTE_OFF_VELOCITY, note_steps
+
+try:
+    import mido
+except ImportError:
+    mido = None
+
+if TYPE_CHECKING:
+    from seqmorph import EucMorpher
+
+
+class PortSink:
+    # Sends to a mido output port, or creates a virtual port other programs can connect to
+    def __init__(self, name: str = None, virtual: bool = False):
+        if mido is None:
+            raise ImportError('PortSink requires mido')
+        self._port = mido.open_output(name, virtual=virtual)
+
+    def send(self, status: int, note: int, velocity: int, t: float):
+        self._port.send(mido.Message.from_bytes([status, note, velocity]))
+
+    def close(self):
+        self._port.close()
+
+
+class FileSink:
+    # Writes one line per event with its scheduled time and actual send time in seconds from the start,
+    # for testing playback without MIDI hardware
+    def __init__(self, path: str, clock=time.monotonic):
+        self._file = open(path, 'w')
+        self._clock = clock
+        self._start = None
+
+    def send(self, status: int, note: int, velocity: int, t: float):
+        now = self._clock()
+        if self._start is None:
+            self._start = now - t
+        self._file.write(f'{t:.6f}\t{now - self._start:.6f}\t{status:#04x}\t{note}\t{velocity}\n')
+
+    def close(self):
+        self._file.close()
+
+
+@dataclass
+class LiveMetrics:
+    bars: int = 0
+    events: int = 0
+    late: int = 0
+    max_jitter: float = 0.0
+    total_jitter: float = 0.0
+
+    def mean_jitter(self) -> float:
+        return self.total_jitter / self.events if self.events else 0.0
+
+
+class LivePlayer:
+    # Plays EucMorpher output in real time on a scheduler thread. Every event is due at a fixed offset
+    # from the start on the monotonic clock, so timing errors never accumulate. The next bar is
+    # generated while the current one plays, and a new morpher takes effect at the next bar boundary.
+    def __init__(self, morpher: 'EucMorpher', sink, start_pos: int = 0, late_threshold: float = 0.002,
+                 spin: float = 0.0005, clock=time.monotonic):
+        self._morpher = morpher
+        self._changed = False
+        self._sink = sink
+        self._pos = start_pos
+        self._late_threshold = late_threshold
+        self._spin = spin
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._metrics = LiveMetrics()
+
+    def set_morpher(self, morpher: 'EucMorpher'):
+        with self._lock:
+            self._morpher = morpher
+            self._changed = True
+
+    def metrics(self) -> LiveMetrics:
+        return self._metrics
+
+    def start(self, num_bars: int = None, delay: float = 0.05):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.play, args=(num_bars, delay), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self, timeout: float = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_bar(self) -> StepSequence:
+        with self._lock:
+            morpher = self._morpher
+            self._changed = False
+        bar = morpher.generate(1, self._pos)
+        self._pos = (self._pos + bar.length()) % len(morpher.prob_steps())
+        return bar
+
+    @staticmethod
+    def _events(bar: StepSequence):
+        # Times in seconds from the start of the bar, including the micro-timing of each step
+        step = 60 / (bar.tempo() * bar.subdivision())
+        on, off = note_steps(bar)
+        times = np.empty(2 * len(on))
+        times[0::2] = on * step
+        times[1::2] = off * step
+        status = np.tile([NOTE_ON, NOTE_OFF], len(on))
+        velocity = np.empty(2 * len(on), dtype=np.int64)
+        velocity[0::2] = bar.velocities()[bar.onsets()]
+        velocity[1::2] = NOTE_OFF_VELOCITY
+        return times.tolist(), status.tolist(), velocity.tolist(), bar.length() * step
+
+    def play(self, num_bars: int = None, delay: float = 0.05):
+        start = self._clock() + delay
+        bar_start = 0.0
+        bar = self._next_bar()
+        played = 0
+        sounding = None
+        while (num_bars is None or played < num_bars) and not self._stop.is_set():
+            times, status, velocity, duration = self._events(bar)
+            pos = self._pos
+            upcoming = self._next_bar()
+            for t, st, vel in zip(times, status, velocity):
+                due = start + bar_start + t
+                if not self._wait(due):
+                    break
+                self._sink.send(st, bar.note(), vel, bar_start + t)
+                sounding = bar.note() if st == NOTE_ON else None
+                self._record(self._clock() - due)
+            if self._stop.is_set():
+                break
+            # Replaces the pre-generated bar if the morpher was changed during this bar
+            if self._changed:
+                self._pos = pos
+                upcoming = self._next_bar()
+            bar = upcoming
+            bar_start += duration
+            played += 1
+            self._metrics.bars = played
+        if sounding is not None:
+            self._sink.send(NOTE_OFF, sounding, NOTE_OFF_VELOCITY, self._clock() - start)
+
+    def _wait(self, due: float) -> bool:
+        # Sleeps until shortly before the event is due, then spins for the last fraction of a millisecond
+        remaining = due - self._clock() - self._spin
+        if remaining > 0 and self._stop.wait(remaining):
+            return False
+        while self._clock() < due:
+            pass
+        return True
+
+    def _record(self, lateness: float):
+        m = self._metrics
+        m.events += 1
+        m.total_jitter += lateness
+        m.max_jitter = max(m.max_jitter, lateness)
+        if lateness > self._late_threshold:
+            m.late += 1
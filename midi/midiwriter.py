@@ -1,9 +1,166 @@
-from mido import MidiFile, MidiTrack, Message, MetaMessage, bpm2tempo
-from seq import StepSequence
+import copy
+import io
+import struct
+from collections.abc import Iterable
+
+import numpy as np
+from seq import StepSequence, metrics
+from .smf import TrackEncoder, NOTE_ON, header, chunk, note_steps
+
+try:
+    from mido import MidiFile, MidiTrack, Message, MetaMessage, bpm2tempo
+except ImportError:
+    MidiFile = None
 
 
 class MidiWriter:
     def __init__(self):
+        self._ticks_per_beat = 480
+        self._encoder = TrackEncoder(self._ticks_per_beat)
+        self._data = bytearray()
+
+    @metrics.timed('MidiWriter.add')
+    def add(self, s: StepSequence):
+        self._data += self._encoder.encode(s)
+
+    def to_bytes(self) -> bytes:
+        return (header(1, self._ticks_per_beat)
+                + chunk(b'MTrk', self._data + self._encoder.end_of_track()))
+
+    @metrics.timed('MidiWriter.save')
+    def save(self, filename: str = 'output.mid'):
+        data = self.to_bytes()
+        metrics.count('midi.bytes', len(data))
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    def print(self):
+        print_midi(self.to_bytes())
+
+
+def print_midi(data: bytes):
+    if MidiFile is None:
+        print('MIDI file: {} bytes (install mido to print messages)'.format(len(data)))
+        return
+    mid = MidiFile(file=io.BytesIO(data))
+    for i, track in enumerate(mid.tracks):
+        print('Track {}: {}'.format(i, track.name))
+        for msg in track:
+            print(msg)
+
+
+class MultiTrackMidiWriter:
+    # Writes one voice per track to a Type-1 file, or with merge=True interleaves all voices
+    # into the single track of a Type-0 file. The tempo is taken from the first voice when merging.
+    def __init__(self, num_tracks: int, merge: bool = False):
+        self._ticks_per_beat = 480
+        self._merge = merge
+        self._encoders = [TrackEncoder(self._ticks_per_beat) for _ in range(num_tracks)]
+        if merge:
+            self._output = TrackEncoder(self._ticks_per_beat)
+            self._tracks = [bytearray()]
+            self._pending = tuple(np.empty(0, dtype=dtype) for dtype in (np.int64, np.uint8, np.uint8, np.uint8))
+        else:
+            self._tracks = [bytearray() for _ in range(num_tracks)]
+
+    def add(self, sequences: list[StepSequence]):
+        if not len(sequences) == len(self._encoders):
+            raise ValueError('expected one sequence per track')
+        if not self._merge:
+            for encoder, track, s in zip(self._encoders, self._tracks, sequences):
+                track += encoder.encode(s)
+            return
+
+        self._tracks[0] += self._output.tempo_event(sequences[0])
+        events = [encoder.events(s) for encoder, s in zip(self._encoders, sequences)]
+        self._pending = tuple(np.concatenate(arrays) for arrays in zip(self._pending, *events))
+        # Voices with different bar lengths run apart, events are only written once no voice can
+        # add anything earlier
+        self._write_pending(min(encoder.tick() for encoder in self._encoders))
+
+    def _write_pending(self, until: int):
+        ticks, status, data1, data2 = self._pending
+        # Orders by time, with note_off before note_on at the same tick
+        order = np.lexsort((status == NOTE_ON, ticks))
+        ready = order[ticks[order] < until]
+        rest = order[ticks[order] >= until]
+        self._tracks[0] += self._output.write_events(ticks[ready], status[ready], data1[ready], data2[ready])
+        self._pending = (ticks[rest], status[rest], data1[rest], data2[rest])
+
+    def to_bytes(self) -> bytes:
+        if self._merge:
+            # Writes the remaining events with a copy of the track state, so more bars can still be added
+            output = copy.copy(self._output)
+            ticks, status, data1, data2 = self._pending
+            order = np.lexsort((status == NOTE_ON, ticks))
+            events = output.write_events(ticks[order], status[order], data1[order], data2[order])
+            end = output.end_of_track(max(encoder.tick() for encoder in self._encoders))
+            return header(1, self._ticks_per_beat, midi_type=0) + chunk(b'MTrk', self._tracks[0] + events + end)
+        return (header(len(self._tracks), self._ticks_per_beat)
+                + b''.join(chunk(b'MTrk', track + encoder.end_of_track())
+                           for track, encoder in zip(self._tracks, self._encoders)))
+
+    @metrics.timed('MultiTrackMidiWriter.save')
+    def save(self, filename: str = 'output.mid'):
+        data = self.to_bytes()
+        metrics.count('midi.bytes', len(data))
+        with open(filename, 'wb') as f:
+            f.write(data)
+
+    def print(self):
+        print_midi(self.to_bytes())
+
+
+class StreamingMidiWriter:
+    # Writes the track to the file as it is generated, flushing every chunk_size bytes and
+    # patching the MTrk chunk length on close, so memory stays constant for any number of bars
+    def __init__(self, filename: str = 'output.mid', chunk_size: int = 1 << 16):
+        self._ticks_per_beat = 480
+        self._encoder = TrackEncoder(self._ticks_per_beat)
+        self._buffer = bytearray()
+        self._chunk_size = chunk_size
+        self._file = open(filename, 'wb')
+        self._file.write(header(1, self._ticks_per_beat) + b'MTrk' + bytes(4))
+        self._track_start = self._file.tell()
+
+    def add(self, s: StepSequence):
+        self._buffer += self._encoder.encode(s)
+        if len(self._buffer) >= self._chunk_size:
+            self.flush()
+
+    def add_all(self, bars: Iterable[StepSequence]):
+        for s in bars:
+            self.add(s)
+
+    def flush(self):
+        self._file.write(self._buffer)
+        self._buffer.clear()
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._buffer += self._encoder.end_of_track()
+        self.flush()
+        length = self._file.tell() - self._track_start
+        metrics.count('midi.bytes', self._track_start + length)
+        if length >= 1 << 32:
+            raise OverflowError('MTrk chunk exceeds the 4 GiB limit of a Standard MIDI File')
+        self._file.seek(self._track_start - 4)
+        self._file.write(struct.pack('>I', length))
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class MidoMidiWriter:
+    # Fallback writer building mido messages, produces the same files as MidiWriter
+    def __init__(self):
+        if MidiFile is None:
+            raise ImportError('MidoMidiWriter requires mido')
         self._mid = MidiFile()
         self._track = MidiTrack()
         self._mid.tracks.append(self._track)
@@ -23,15 +180,18 @@ class MidiWriter:
             self._subdivision = s.subdivision()
             self._timestep = self._mid.ticks_per_beat // self._subdivision
 
-        for step in s.sequence():
-            if step.onset:
-                self._track.append(Message(
-                    'note_on', note=s.note(), velocity=step.velocity, time=self._timer))
-                self._track.append(Message(
-                    'note_off', note=s.note(), time=self._timestep))
-                self._timer = 0
-            else:
-                self._timer += self._timestep
+        last = 0
+        on, off = note_steps(s)
+        for on_tick, off_tick, velocity in zip(np.rint(on * self._timestep).astype(int).tolist(),
+                                               np.rint(off * self._timestep).astype(int).tolist(),
+                                               s.velocities()[s.onsets()].tolist()):
+            self._track.append(Message(
+                'note_on', note=s.note(), velocity=velocity, time=self._timer + on_tick - last))
+            self._track.append(Message(
+                'note_off', note=s.note(), time=off_tick - on_tick))
+            self._timer = 0
+            last = off_tick
+        self._timer += s.length() * self._timestep - last
 
     def save(self, filename: str = 'output.mid'):
         self._track.append(MetaMessage(
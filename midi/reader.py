@@ -0,0 +1,208 @@
+import argparse
+import json
+import os
+from collections.abc import Iterable, Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+
+import numpy as np
+
+from seq import StepSequence, metrics
+
+# Imports base patterns from Standard MIDI Files. The files are parsed straight from their bytes,
+# collecting only note_on events into arrays, and the onsets of every note are quantized to the step grid.
+#
+# Run with: python -m midi.reader grooves/ -o patterns.jsonl -j 8
+
+
+@dataclass
+class NoteOns:
+    ticks_per_beat: int
+    ticks: np.ndarray
+    notes: np.ndarray
+    velocities: np.ndarray
+    # Beats of the first time signature, 4/4 if the file has none
+    beats_per_bar: float = 4.0
+
+
+@dataclass(eq=False)
+class Pattern:
+    path: str
+    note: int
+    length: int
+    # Onsets packed eight steps per byte with np.packbits
+    bits: np.ndarray
+    velocities: np.ndarray
+
+    def onsets(self) -> np.ndarray:
+        return np.unpackbits(self.bits, count=self.length).astype(bool)
+
+    def pattern_string(self) -> str:
+        return (self.onsets().view(np.uint8) + ord('0')).tobytes().decode()
+
+    def sequence(self, **kwargs) -> StepSequence:
+        # Base sequence for the morph pipeline, kwargs are passed on to StepSequence
+        onsets = self.onsets()
+        velocities = np.zeros(self.length, dtype=np.uint8)
+        velocities[onsets] = self.velocities
+        return StepSequence(note=self.note, **kwargs).init_from_arrays(onsets, velocities)
+
+
+def _varint(data: bytes, i: int) -> tuple[int, int]:
+    value = 0
+    while True:
+        b = data[i]
+        i += 1
+        value = (value << 7) | (b & 0x7F)
+        if not b & 0x80:
+            return value, i
+
+
+def read_note_ons(data: bytes, channel: int = None) -> NoteOns:
+    if data[:4] != b'MThd':
+        raise ValueError('not a Standard MIDI File')
+    header_length = int.from_bytes(data[4:8], 'big')
+    midi_type, num_tracks, division = (int.from_bytes(data[i:i + 2], 'big') for i in (8, 10, 12))
+    if division & 0x8000:
+        raise ValueError('SMPTE time division is not supported')
+    if midi_type == 2:
+        raise ValueError('Type 2 MIDI files are not supported')
+
+    ticks, notes, velocities = [], [], []
+    beats_per_bar = None
+    pos = 8 + header_length
+    for _ in range(num_tracks):
+        if pos + 8 > len(data):
+            break
+        name, length = data[pos:pos + 4], int.from_bytes(data[pos + 4:pos + 8], 'big')
+        i, end = pos + 8, min(pos + 8 + length, len(data))
+        pos = end
+        if name != b'MTrk':
+            continue
+
+        tick = 0
+        status = 0
+        while i < end:
+            delta, i = _varint(data, i)
+            tick += delta
+            b = data[i]
+            if b == 0xFF:
+                meta_type = data[i + 1]
+                size, i = _varint(data, i + 2)
+                if meta_type == 0x2F:
+                    break
+                if meta_type == 0x58 and beats_per_bar is None:
+                    beats_per_bar = data[i] * 4 / (1 << data[i + 1])
+                i += size
+                continue
+            if b == 0xF0 or b == 0xF7:
+                size, i = _varint(data, i + 1)
+                i += size
+                continue
+            if b & 0x80:
+                status = b
+                i += 1
+            elif not status:
+                raise ValueError('running status without a preceding status byte')
+            kind = status & 0xF0
+            if kind == 0xC0 or kind == 0xD0:
+                i += 1
+                continue
+            if kind == 0x90 and data[i + 1] and (channel is None or status & 0x0F == channel):
+                ticks.append(tick)
+                notes.append(data[i])
+                velocities.append(data[i + 1])
+            i += 2
+
+    metrics.count('import.note_ons', len(ticks))
+    return NoteOns(division, np.array(ticks, dtype=np.int64), np.array(notes, dtype=np.uint8),
+                   np.array(velocities, dtype=np.uint8), beats_per_bar or 4.0)
+
+
+def quantize(ticks: np.ndarray, ticks_per_beat: int, subdivision: int = 4) -> np.ndarray:
+    # Nearest step of each tick on a grid of subdivision steps per beat
+    return np.rint(ticks * (subdivision / ticks_per_beat)).astype(np.int64)
+
+
+def extract_patterns(note_ons: NoteOns, subdivision: int = 4, path: str = '') -> list[Pattern]:
+    # One pattern per note, padded to whole bars, with the velocity of the loudest onset on each step
+    if len(note_ons.ticks) == 0:
+        return []
+    steps = quantize(note_ons.ticks, note_ons.ticks_per_beat, subdivision)
+    bar = max(1, int(round(note_ons.beats_per_bar * subdivision)))
+    length = (int(steps.max()) // bar + 1) * bar
+
+    patterns = []
+    for note in np.unique(note_ons.notes).tolist():
+        selected = note_ons.notes == note
+        velocities = np.zeros(length, dtype=np.uint8)
+        np.maximum.at(velocities, steps[selected], note_ons.velocities[selected])
+        onsets = velocities > 0
+        patterns.append(Pattern(path, note, length, np.packbits(onsets), velocities[onsets]))
+    return patterns
+
+
+def read_patterns(path: str, subdivision: int = 4, channel: int = None) -> list[Pattern]:
+    with open(path, 'rb') as f:
+        data = f.read()
+    return extract_patterns(read_note_ons(data, channel), subdivision, path)
+
+
+def find_midi_files(paths: Iterable[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(('.mid', '.midi')):
+                    yield os.path.join(root, name)
+
+
+def _read_or_skip(path: str, subdivision: int, channel: int) -> list[Pattern] | None:
+    try:
+        return read_patterns(path, subdivision, channel)
+    except (ValueError, IndexError, OSError):
+        return None
+
+
+def scan(paths: Iterable[str], subdivision: int = 4, channel: int = None, workers: int = None,
+         chunksize: int = 16, errors: list = None) -> Iterator[Pattern]:
+    # Streams the patterns of every MIDI file in paths and directories, parsed on worker processes in
+    # the order of the files. Files that cannot be parsed are skipped and appended to errors.
+    files = list(find_midi_files(paths))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        read = partial(_read_or_skip, subdivision=subdivision, channel=channel)
+        for path, patterns in zip(files, executor.map(read, files, chunksize=chunksize)):
+            if patterns is None:
+                if errors is not None:
+                    errors.append(path)
+                continue
+            yield from patterns
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m midi.reader',
+                                     description='Extract per-note base patterns from MIDI files.')
+    parser.add_argument('paths', nargs='+', help='MIDI files or directories to scan')
+    parser.add_argument('-o', '--out', default='patterns.jsonl', help='output file (default: patterns.jsonl)')
+    parser.add_argument('-s', '--subdivision', type=int, default=4, help='steps per beat (default: 4)')
+    parser.add_argument('-c', '--channel', type=int, default=None, help='only read this channel (0-15)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    args = parser.parse_args(argv)
+
+    count = 0
+    errors = []
+    with open(args.out, 'w') as out:
+        for pattern in scan(args.paths, args.subdivision, args.channel, args.workers, errors=errors):
+            out.write(json.dumps({'file': pattern.path, 'note': pattern.note, 'length': pattern.length,
+                                  'pattern': pattern.pattern_string()}) + '\n')
+            count += 1
+    print('Extracted ' + str(count) + ' patterns to ' + args.out
+          + ('' if not errors else ', skipped ' + str(len(errors)) + ' unreadable files'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+import struct
+
+import numpy as np
+
+from seq import StepSequence, metrics
+
+# Standard MIDI File encoding written straight into byte buffers,
+# producing the same bytes as mido does for the same messages
+
+NOTE_ON = 0x90
+NOTE_OFF = 0x80
+NOTE_OFF_VELOCITY = 64
+END_OF_TRACK = b'\xff\x2f\x00'
+
+
+def bpm2tempo(bpm) -> int:
+    return int(round(60 * 1e6 / bpm))
+
+
+def encode_varint(value: int) -> bytes:
+    groups = [value & 0x7F]
+    value >>= 7
+    while value:
+        groups.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(groups))
+
+
+def set_tempo(tempo: int) -> bytes:
+    return b'\xff\x51\x03' + tempo.to_bytes(3, 'big')
+
+
+def encode_events(deltas: np.ndarray, status: np.ndarray, data1: np.ndarray, data2: np.ndarray,
+                  running_status: int = None) -> tuple[bytes, int]:
+    # Encodes channel messages as one byte matrix, with one row of varint delta plus message per event,
+    # and drops the status byte where running status applies. Returns the bytes and the running status.
+    deltas = np.asarray(deltas, dtype=np.int64)
+    if len(deltas) == 0:
+        return b'', running_status
+    if deltas.min() < 0 or deltas.max() >= 1 << 28:
+        raise ValueError('delta time out of range for a variable length quantity')
+
+    rows = np.zeros((len(deltas), 7), dtype=np.uint8)
+    keep = np.ones(rows.shape, dtype=bool)
+
+    shifts = np.array([21, 14, 7, 0])
+    groups = (deltas[:, None] >> shifts) & 0x7F
+    width = 1 + (deltas[:, None] >= 1 << shifts[:3]).sum(axis=1)
+    rows[:, :4] = groups | np.where(shifts > 0, 0x80, 0)
+    keep[:, :4] = np.arange(4) >= 4 - width[:, None]
+
+    status = np.broadcast_to(np.asarray(status, dtype=np.uint8), deltas.shape)
+    previous = np.concatenate(([-1 if running_status is None else running_status], status[:-1]))
+    rows[:, 4] = status
+    rows[:, 5] = data1
+    rows[:, 6] = data2
+    keep[:, 4] = status != previous
+
+    return rows[keep].tobytes(), int(status[-1])
+
+
+def note_steps(s: StepSequence) -> tuple[np.ndarray, np.ndarray]:
+    # Note on and note off positions in steps from the start of the sequence. Micro-timing offsets
+    # move notes within the sequence only, and each note is cut short at the next note_on, so the
+    # events stay in order and notes never overlap.
+    index = np.flatnonzero(s.onsets())
+    on = np.clip(index + s.offsets()[index].astype(np.float64), 0, s.length())
+    off = np.minimum(on + 1, np.append(on[1:], s.length()))
+    return on, off
+
+
+def header(num_tracks: int, ticks_per_beat: int, midi_type: int = 1) -> bytes:
+    return b'MThd' + struct.pack('>Ihhh', 6, midi_type, num_tracks, ticks_per_beat)
+
+
+def chunk(name: bytes, data: bytes) -> bytes:
+    return name + struct.pack('>I', len(data)) + data
+
+
+class TrackEncoder:
+    # Keeps the timing state of one track in absolute ticks. Events are written with delta times
+    # relative to the last written event, so rests carry over between encoded sequences.
+    def __init__(self, ticks_per_beat: int = 480):
+        self._ticks_per_beat = ticks_per_beat
+        self._tempo: int = 120
+        self._subdivision: int = 4
+        self._timestep = ticks_per_beat // self._subdivision
+        self._tick = 0
+        self._last = 0
+        self._running_status = None
+
+    def tick(self) -> int:
+        return self._tick
+
+    def tempo_event(self, s: StepSequence) -> bytes:
+        if s.tempo() == self._tempo:
+            return b''
+        self._tempo = s.tempo()
+        self._running_status = None
+        return encode_varint(0) + set_tempo(bpm2tempo(self._tempo))
+
+    def events(self, s: StepSequence) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        # Note events of the sequence as absolute ticks, status bytes, notes and velocities,
+        # starting where the previous sequence ended
+        if not s.subdivision() == self._subdivision:
+            self._subdivision = s.subdivision()
+            self._timestep = self._ticks_per_beat // self._subdivision
+
+        onsets = s.onsets()
+        velocities = s.velocities()[onsets]
+        if not 0 <= s.note() <= 127 or (velocities > 127).any():
+            raise ValueError('note and velocity must be in range 0..127')
+
+        on, off = note_steps(s)
+        ticks = np.empty(2 * len(on), dtype=np.int64)
+        ticks[0::2] = self._tick + np.rint(on * self._timestep).astype(np.int64)
+        ticks[1::2] = self._tick + np.rint(off * self._timestep).astype(np.int64)
+        status = np.tile(np.array([NOTE_ON, NOTE_OFF], dtype=np.uint8), len(on))
+        data2 = np.empty(2 * len(on), dtype=np.uint8)
+        data2[0::2] = velocities
+        data2[1::2] = NOTE_OFF_VELOCITY
+
+        self._tick += s.length() * self._timestep
+        return ticks, status, np.full(len(ticks), s.note(), dtype=np.uint8), data2
+
+    def write_events(self, ticks: np.ndarray, status: np.ndarray, data1: np.ndarray, data2: np.ndarray) -> bytes:
+        if len(ticks) == 0:
+            return b''
+        data, self._running_status = encode_events(np.diff(ticks, prepend=self._last), status, data1, data2,
+                                                   self._running_status)
+        self._last = int(ticks[-1])
+        metrics.count('midi.events', len(ticks))
+        return data
+
+    def encode(self, s: StepSequence) -> bytes:
+        return self.tempo_event(s) + self.write_events(*self.events(s))
+
+    def end_of_track(self, tick: int = None) -> bytes:
+        return encode_varint((self._tick if tick is None else tick) - self._last) + END_OF_TRACK
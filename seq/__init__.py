@@ -1,2 +1,5 @@
 from .stepseq import Step, StepSequence, StepSequence
-from .euc import euc
+from .euc import euc, euc_cache, euclid_words, use_euc_table
+from .cache import LRUCache
+from .metrics import metrics, Metrics
+from .rhythm import Rhythm, RhythmIndex, dedupe, euclidean_index
@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import NamedTuple
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 128):
+        self._maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, compute):
+        # Returns the cached value for key, computing and storing it on a miss
+        with self._lock:
+            if key in self._data:
+                self._hits += 1
+                self._data.move_to_end(key)
+                return self._data[key]
+            self._misses += 1
+        value = compute()
+        with self._lock:
+            self._data[key] = value
+            self._evict()
+        return value
+
+    def _evict(self):
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+    def resize(self, maxsize: int):
+        with self._lock:
+            self._maxsize = maxsize
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._hits = 0
+            self._misses = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(self._hits, self._misses, self._maxsize, len(self._data))
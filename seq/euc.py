@@ -1,11 +1,67 @@
 from itertools import chain
 
+import numpy as np
+
+from .cache import LRUCache
+from .metrics import metrics
+
+euc_cache = LRUCache(1024)
+
+# Precomputed table of every pattern, see seq.table, installed with use_euc_table
+_table = None
+
+
+@metrics.timed('euc')
+def euc(onsets, subdivisions, rotation) -> tuple[int, ...]:
+    if _table is not None and 0 <= onsets <= subdivisions < _table.shape[0] and 0 <= rotation < subdivisions:
+        return unpack(int(_table[subdivisions, onsets, rotation]), subdivisions)
+    # Unrotated patterns are cached as immutable tuples, so changing only the rotation is a slice
+    pattern = euc_cache.get((onsets, subdivisions), lambda: tuple(euclid_words(onsets, subdivisions)))
+    return rotate(pattern, rotation)
+
+
+def rotate(pattern: tuple, rotation) -> tuple:
+    return pattern[-rotation:] + pattern[:-rotation]
+
+
+def euclid_words(onsets, subdivisions) -> bytes:
+    # Builds the same pattern as bjorklund in O(n) by regrouping whole words instead of single lists.
+    # After the first pass the pattern is always a copies of a word x followed by b copies of a word y,
+    # and each pass of the while loop in bjorklund turns that into x' = x y x^(a//b - 1), y' = x.
+    a = min(onsets, subdivisions - onsets)
+    b = max(onsets, subdivisions - onsets)
+    if a < 1:
+        ones = min(max(onsets, 0), max(subdivisions, 0))
+        return b'\x01' * ones + b'\x00' * (max(subdivisions, 0) - ones)
+
+    q = b // a
+    if onsets <= subdivisions - onsets:
+        x, y = b'\x01' + b'\x00' * q, b'\x00'
+    else:
+        x, y = b'\x01\x00' + b'\x01' * (q - 1), b'\x01'
+    b = b % a
+
+    while b > 1:
+        x, y = x + y + x * (a // b - 1), x
+        a, b = b, a % b
+    return x * a + y * b
+
+
+def unpack(bits: int, length: int) -> tuple[int, ...]:
+    return tuple(((bits >> np.arange(length, dtype=np.uint64)) & 1).tolist()) if length else ()
+
+
+def use_euc_table(table: np.ndarray | None):
+    global _table
+    _table = table
+
+
 # Created by implementing the operations of Bjorklund's algorithm as described in:
 # "Structural properties of Euclidean rhythms", 2009
 # DOI: https://doi.org/10.1080/17459730902819566
 
 
-def euc(onsets, subdivisions, rotation) -> list[int]:
+def bjorklund(onsets, subdivisions, rotation) -> list[int]:
     s = [[1] if i < onsets else [0] for i in range(subdivisions)]
     a = min(onsets, subdivisions - onsets)
     b = max(onsets, subdivisions - onsets)
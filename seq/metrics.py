@@ -0,0 +1,129 @@
+import cProfile
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from threading import Lock
+
+# Counters and timing spans around the hot paths. Recording is off by default, the instrumented
+# functions then only pay for a check of metrics.enabled.
+#
+#   metrics.enable()
+#   ...
+#   metrics.export('metrics.json')  # or metrics.prom for the Prometheus text format
+
+
+@dataclass
+class Span:
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self._lock = Lock()
+        self._counters: dict[str, int] = {}
+        self._spans: dict[str, Span] = {}
+        self._profile = None
+
+    def enable(self, profile: bool = False):
+        # With profile=True a cProfile capture of the calling thread runs until disable()
+        if profile and self._profile is None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        if self._profile is not None:
+            self._profile.disable()
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._spans.clear()
+        # A running capture is stopped before it is dropped, disable() could not reach it afterwards
+        if self._profile is not None:
+            self._profile.disable()
+        self._profile = None
+
+    def count(self, name: str, value: int = 1):
+        if self.enabled:
+            with self._lock:
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            span = self._spans.setdefault(name, Span())
+            span.count += 1
+            span.total += seconds
+            span.max = max(span.max, seconds)
+
+    @contextmanager
+    def span(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def timed(self, name: str):
+        # Decorator recording every call of the function as a span
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {'counters': dict(self._counters),
+                    'spans': {name: {'count': span.count, 'total': span.total, 'max': span.max}
+                              for name, span in self._spans.items()}}
+
+    def prometheus(self) -> str:
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].items()):
+            metric = 'seqmorph_' + _metric_name(name) + '_total'
+            lines += ['# TYPE ' + metric + ' counter', metric + ' ' + str(value)]
+        if snapshot['spans']:
+            lines += ['# TYPE seqmorph_span_seconds summary']
+        for name, span in sorted(snapshot['spans'].items()):
+            label = '{span="' + name + '"}'
+            lines += ['seqmorph_span_seconds_count' + label + ' ' + str(span['count']),
+                      'seqmorph_span_seconds_sum' + label + ' ' + repr(span['total'])]
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path: str):
+        # Writes a Prometheus text file for .prom/.txt, cProfile stats for .prof, JSON otherwise
+        if path.endswith('.prof'):
+            if self._profile is None:
+                raise ValueError('no profile was captured, enable metrics with profile=True')
+            self._profile.dump_stats(path)
+            return
+        with open(path, 'w') as f:
+            if path.endswith(('.prom', '.txt')):
+                f.write(self.prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=2)
+
+
+def _metric_name(name: str) -> str:
+    return ''.join(c if c.isalnum() else '_' for c in name)
+
+
+metrics = Metrics()
@@ -0,0 +1,140 @@
+import numpy as np
+
+from .euc import euc
+
+# Number of set bits in every byte value, used for popcount on numpy versions without np.bitwise_count
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(values).astype(np.int64)
+    return _POPCOUNT[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.int64)
+
+
+class Rhythm:
+    # A rhythm packed into the bits of an int, step i is bit i
+    __slots__ = ('bits', 'length')
+
+    def __init__(self, bits: int, length: int):
+        self.bits = bits
+        self.length = length
+
+    @classmethod
+    def from_onsets(cls, onsets) -> 'Rhythm':
+        onsets = np.asarray(onsets, dtype=bool)
+        return cls(int.from_bytes(np.packbits(onsets, bitorder='little').tobytes(), 'little'), len(onsets))
+
+    @classmethod
+    def from_sequence(cls, s) -> 'Rhythm':
+        return cls.from_onsets(s.onsets())
+
+    @classmethod
+    def from_string(cls, pattern: str) -> 'Rhythm':
+        # Accepts both '1001' and 'x..x' notation
+        return cls.from_onsets([c in '1x' for c in pattern.strip('[]')])
+
+    def onsets(self) -> np.ndarray:
+        data = np.frombuffer(self.bits.to_bytes((self.length + 7) // 8, 'little'), dtype=np.uint8)
+        return np.unpackbits(data, count=self.length, bitorder='little').astype(bool)
+
+    def __eq__(self, other):
+        return isinstance(other, Rhythm) and self.bits == other.bits and self.length == other.length
+
+    def __hash__(self):
+        return hash((self.bits, self.length))
+
+    def __str__(self):
+        return '[' + ''.join('x' if onset else '.' for onset in self.onsets()) + ']'
+
+    def __repr__(self):
+        return 'Rhythm(' + str(self) + ')'
+
+    def onset_count(self) -> int:
+        return self.bits.bit_count()
+
+    def rotate(self, rotation: int) -> 'Rhythm':
+        # Same direction as euc, step i moves to step i + rotation
+        if self.length == 0:
+            return self
+        r = rotation % self.length
+        mask = (1 << self.length) - 1
+        return Rhythm(((self.bits << r) | (self.bits >> (self.length - r))) & mask, self.length)
+
+    def rotations(self) -> list['Rhythm']:
+        return [self.rotate(r) for r in range(max(self.length, 1))]
+
+    def canonical(self) -> 'Rhythm':
+        # The same for all rotations of a rhythm
+        return min(self.rotations(), key=lambda rhythm: rhythm.bits)
+
+    def hamming(self, other: 'Rhythm') -> int:
+        if not self.length == other.length:
+            raise ValueError('rhythms must have the same length')
+        return (self.bits ^ other.bits).bit_count()
+
+    def onset_distance(self, other: 'Rhythm') -> int:
+        return abs(self.onset_count() - other.onset_count())
+
+
+def dedupe(rhythms, rotation_invariant: bool = False) -> list[Rhythm]:
+    # Keeps the first of every group of equal rhythms, or of rhythms that are rotations of each other
+    seen = set()
+    unique = []
+    for rhythm in rhythms:
+        key = rhythm.canonical() if rotation_invariant else rhythm
+        if key not in seen:
+            seen.add(key)
+            unique.append(rhythm)
+    return unique
+
+
+class RhythmIndex:
+    # Rhythms of one length (at most 64 steps) packed into a uint64 array, searched with vectorized popcounts
+    def __init__(self, length: int):
+        if length > 64:
+            raise ValueError('a RhythmIndex supports lengths up to 64 steps')
+        self._length = length
+        self._bits = np.empty(0, dtype=np.uint64)
+        self._labels = []
+
+    def __len__(self):
+        return len(self._labels)
+
+    def add(self, rhythm: Rhythm, label=None):
+        self.add_many([rhythm], [label])
+
+    def add_many(self, rhythms: list[Rhythm], labels: list = None):
+        if any(not rhythm.length == self._length for rhythm in rhythms):
+            raise ValueError('rhythms must have the length of the index')
+        self._bits = np.concatenate((self._bits, np.array([rhythm.bits for rhythm in rhythms], dtype=np.uint64)))
+        self._labels.extend(labels if labels is not None else [None] * len(rhythms))
+
+    def distances(self, rhythm: Rhythm, metric: str = 'hamming', rotation_invariant: bool = False) -> np.ndarray:
+        queries = rhythm.rotations() if rotation_invariant else [rhythm]
+        query = np.array([q.bits for q in queries], dtype=np.uint64)[:, None]
+        if metric == 'hamming':
+            d = popcount(self._bits[None, :] ^ query)
+        elif metric == 'onsets':
+            d = np.abs(popcount(self._bits)[None, :] - popcount(query))
+        else:
+            raise ValueError('unknown metric: ' + metric)
+        return d.min(axis=0)
+
+    def nearest(self, rhythm: Rhythm, count: int = 5, metric: str = 'hamming',
+                rotation_invariant: bool = False) -> list[tuple[int, object, Rhythm]]:
+        # The closest indexed rhythms as (distance, label, rhythm), closest first
+        d = self.distances(rhythm, metric, rotation_invariant)
+        count = min(count, len(d))
+        best = np.argpartition(d, count - 1)[:count] if count else np.empty(0, dtype=np.int64)
+        best = best[np.argsort(d[best], kind='stable')]
+        return [(int(d[i]), self._labels[i], Rhythm(int(self._bits[i]), self._length)) for i in best]
+
+
+def euclidean_index(length: int) -> RhythmIndex:
+    # Every Euclidean rhythm of the given length, labelled with its (onsets, length, rotation)
+    index = RhythmIndex(length)
+    params = [(k, length, r) for k in range(length + 1) for r in range(max(length, 1))]
+    index.add_many([Rhythm.from_onsets(euc(k, n, r)) for k, n, r in params], params)
+    return index
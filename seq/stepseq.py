@@ -1,15 +1,35 @@
+from collections.abc import Sequence
 from dataclasses import dataclass
 
+import numpy as np
+
 
 @dataclass
 class Step:
     onset: bool = False
     velocity: int = 0
+    offset: float = 0.0
 
     def __str__(self):
         return '| ' + ('x' if self.onset else '.') + ' | '  # + str(self.velocity)
 
 
+class StepView(Sequence):
+    # Read-only view that builds Step objects on access from the arrays of a StepSequence
+    def __init__(self, onsets: np.ndarray, velocities: np.ndarray, offsets: np.ndarray):
+        self._onsets = onsets
+        self._velocities = velocities
+        self._offsets = offsets
+
+    def __len__(self):
+        return len(self._onsets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        return Step(bool(self._onsets[index]), int(self._velocities[index]), float(self._offsets[index]))
+
+
 class StepSequence:
 
     def __init__(self, length: int = 0, note: int = 36, default_velocity: int = 100,
@@ -18,63 +38,101 @@ class StepSequence:
         self._default_velocity = default_velocity
         self._tempo = tempo
         self._subdivision = subdivision
-        self._sequence = [Step() for _ in range(length)]
+        self._onsets = np.zeros(length, dtype=bool)
+        self._velocities = np.zeros(length, dtype=np.uint8)
+        # Micro-timing of each step as a fraction of a step, -0.5..0.5
+        self._offsets = np.zeros(length, dtype=np.float32)
+
+    def init_from_list(self, rhythmic_pattern):
+        self._onsets = np.array(rhythmic_pattern, dtype=bool)
+        self._velocities = np.where(self._onsets, self._default_velocity, 0).astype(np.uint8)
+        self._offsets = np.zeros(len(self._onsets), dtype=np.float32)
+        return self
 
-    def init_from_list(self, rhythmic_pattern: list):
-        self._sequence = [Step() for _ in range(len(rhythmic_pattern))]
-        for i, element in enumerate(rhythmic_pattern):
-            if element:
-                self.set_step(i)
+    def init_from_arrays(self, onsets: np.ndarray, velocities: np.ndarray, offsets: np.ndarray = None):
+        self._onsets = np.asarray(onsets, dtype=bool)
+        self._velocities = np.asarray(velocities, dtype=np.uint8)
+        self._offsets = (np.zeros(len(self._onsets), dtype=np.float32) if offsets is None
+                         else np.clip(np.asarray(offsets, dtype=np.float32), -0.5, 0.5))
         return self
 
     def __str__(self):
         s = 'STEP SEQUENCE\n'
         s += ('note: ' + str(self._note) + ', default_velocity: ' + str(self._default_velocity)
-              + ', length: ' + str(len(self._sequence)) + '\n')
+              + ', length: ' + str(self.length()) + '\n')
         seq = []
-        for i in range(len(self._sequence)):
-            seq.append(str(i) + ':\t' + str(self._sequence[i]))
+        for i, step in enumerate(self.sequence()):
+            seq.append(str(i) + ':\t' + str(step))
         return s + '\n'.join(seq)
 
     def seq_string(self):
         seq = []
-        for i in range(len(self._sequence)):
-            seq.append(str(i+1) + ':\t' + str(self._sequence[i]))
+        for i, step in enumerate(self.sequence()):
+            seq.append(str(i+1) + ':\t' + str(step))
         return '\n'.join(seq)
 
     def rhythm_notation(self):
-        return '[' + ''.join(['x' if step.onset else '.' for step in self._sequence]) + ']'
+        return '[' + np.where(self._onsets, ord('x'), ord('.')).astype(np.uint8).tobytes().decode() + ']'
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._with_arrays(self._onsets[index].copy(), self._velocities[index].copy(),
+                                     self._offsets[index].copy())
+        return self.sequence()[index]
+
+    def __add__(self, other):
+        if not isinstance(other, StepSequence):
+            return NotImplemented
+        return self._with_arrays(np.concatenate((self._onsets, other.onsets())),
+                                 np.concatenate((self._velocities, other.velocities())),
+                                 np.concatenate((self._offsets, other.offsets())))
+
+    def _with_arrays(self, onsets: np.ndarray, velocities: np.ndarray, offsets: np.ndarray):
+        return (StepSequence(note=self._note, default_velocity=self._default_velocity,
+                             tempo=self._tempo, subdivision=self._subdivision)
+                .init_from_arrays(onsets, velocities, offsets))
 
     def toggle_step(self, index: int):
-        self._sequence[index].onset = not self._sequence[index].onset
+        self._onsets[index] = not self._onsets[index]
 
     def set_step(self, index: int, velocity: int = None):
-        self._sequence[index].onset = True
-        self._sequence[index].velocity = velocity if velocity is not None else self._default_velocity
+        self._onsets[index] = True
+        self._velocities[index] = velocity if velocity is not None else self._default_velocity
 
-    def add(self, onset: bool = False, velocity: int = None):
+    def add(self, onset: bool = False, velocity: int = None, offset: float = 0.0):
         if velocity is None:
             velocity = self._default_velocity
-        self._sequence.append(Step(onset, velocity))
+        self._onsets = np.append(self._onsets, onset)
+        self._velocities = np.append(self._velocities, np.uint8(velocity))
+        self._offsets = np.append(self._offsets, np.float32(np.clip(offset, -0.5, 0.5)))
+
+    def extend(self, other):
+        self._onsets = np.concatenate((self._onsets, other.onsets()))
+        self._velocities = np.concatenate((self._velocities, other.velocities()))
+        self._offsets = np.concatenate((self._offsets, other.offsets()))
 
     def has_onset(self):
-        return any(step.onset for step in self._sequence)
+        return bool(self._onsets.any())
 
     def is_same_rhythm(self, other):
         if not isinstance(other, StepSequence):
             return False
-        if self.length() != other.length():
-            return False
-        for i in range(self.length()):
-            if not self._sequence[i].onset == other.sequence()[i].onset:
-                return False
-        return True
+        return np.array_equal(self._onsets, other.onsets())
 
     def length(self):
-        return len(self._sequence)
+        return len(self._onsets)
 
     def sequence(self):
-        return self._sequence
+        return StepView(self._onsets, self._velocities, self._offsets)
+
+    def onsets(self) -> np.ndarray:
+        return self._onsets
+
+    def velocities(self) -> np.ndarray:
+        return self._velocities
+
+    def offsets(self) -> np.ndarray:
+        return self._offsets
 
     def note(self):
         return self._note
@@ -0,0 +1,38 @@
+import argparse
+
+import numpy as np
+
+from .euc import euclid_words
+
+# Precomputed Euclidean rhythms, stored on disk so tools can memory-map them at startup.
+# Build with: python -m seq.table euc_table.npy
+
+
+def euc_table(n_max: int = 64) -> np.ndarray:
+    # Every pattern with n <= n_max packed into a uint64 (bit i is step i), indexed as [n, k, r]
+    if n_max > 64:
+        raise ValueError('packed Euclidean tables support lengths up to 64 steps')
+    table = np.zeros((n_max + 1, n_max + 1, max(n_max, 1)), dtype=np.uint64)
+    for n in range(1, n_max + 1):
+        mask = (1 << n) - 1
+        for k in range(n + 1):
+            v = sum(1 << i for i, onset in enumerate(euclid_words(k, n)) if onset)
+            # Rotating by r moves step i to i + r
+            table[n, k, :n] = [((v << r) | (v >> (n - r))) & mask for r in range(n)]
+    return table
+
+
+def save_euc_table(path: str, n_max: int = 64):
+    np.save(path, euc_table(n_max))
+
+
+def load_euc_table(path: str) -> np.ndarray:
+    return np.load(path, mmap_mode='r')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m seq.table', description='Precompute the Euclidean rhythm table.')
+    parser.add_argument('path', help='.npy file to write')
+    parser.add_argument('--n-max', type=int, default=64)
+    args = parser.parse_args()
+    save_euc_table(args.path, args.n_max)
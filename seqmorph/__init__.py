@@ -1,2 +1,9 @@
-from .probsteps import ProbStep, SimpleProbStepAlg, SimpleProbStepAlgV2, DirectMorph100, DirectMorph50, MegaMorphV1, TestingNoRandom
-from .eucmorpher import EucMorpher
+from .probsteps import ProbStep, ProbStepArray, ProbStepAlg, SimpleProbStepAlg, SimpleProbStepAlgV2, DirectMorph100, DirectMorph50, MegaMorphV1, TestingNoRandom, PeriodicProbSteps, MorphInputs, register, morphers, evaluate_all
+from .eucmorpher import EucMorpher, prob_steps_cache
+from .expression import Expression
+from .markov import MarkovMorpher
+from .cursor import HyperperiodCursor
+from . import automation
+from .stats import MorphStats, bar_statistics, onset_count_distribution, pattern_probability
+from .session import Session, GenerateParams
+from .multivoice import MultiVoiceMorpher, Voice
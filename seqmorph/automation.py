@@ -0,0 +1,21 @@
+import numpy as np
+
+# Morph amount curves with one amount (0..100) per bar, for EucMorpher.generate_automated
+
+
+def linear(start: float, end: float, num_bars: int) -> np.ndarray:
+    return np.linspace(start, end, num_bars)
+
+
+def exponential(start: float, end: float, num_bars: int, steepness: float = 4.0) -> np.ndarray:
+    # Starts slowly and speeds up towards end, or the other way round with a negative steepness
+    t = np.linspace(0, 1, num_bars)
+    if steepness == 0:
+        return start + (end - start) * t
+    return start + (end - start) * np.expm1(steepness * t) / np.expm1(steepness)
+
+
+def breakpoints(points: list[tuple[int, float]], num_bars: int) -> np.ndarray:
+    # Linear ramps between (bar, amount) points, holding the first and last amounts before and after them
+    bars, amounts = zip(*sorted(points))
+    return np.interp(np.arange(num_bars), bars, amounts)
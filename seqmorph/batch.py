@@ -0,0 +1,169 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from functools import partial
+
+from seq import use_euc_table, metrics
+from seq.table import load_euc_table
+from .eucmorpher import use_disk_cache
+from .probsteps import morphers
+from .rendercache import RenderCache
+from .session import Session, GenerateParams
+
+# Headless parameter-sweep rendering. The sweep spec is a JSON object where every parameter is
+# a single value, a list of values or a range {"start": 0, "stop": 8, "step": 1} (stop exclusive):
+#
+#   {"patterns": ["1000100010001000"], "onsets": {"start": 1, "stop": 9}, "length": 16,
+#    "rotation": [0, 2], "amount": [25, 50, 75], "algorithm": ["MegaMorphV1"], "bars": 4,
+#    "seeds": [0, 1, 2], "tempo": 120, "subdivision": 4, "note": 36}
+#
+# Run with: python -m seqmorph.batch sweep.json -o renders -j 8
+#
+# With --cache DIR rendered files are kept in a content-addressed cache, so rerunning unchanged jobs
+# only copies the cached files.
+
+SWEEP_KEYS = ('patterns', 'onsets', 'length', 'rotation', 'amount', 'algorithm', 'bars', 'seeds',
+              'tempo', 'subdivision', 'note')
+DEFAULTS = {'onsets': 0, 'length': 16, 'rotation': 0, 'amount': 0, 'algorithm': 'DirectMorph100',
+            'bars': 1, 'seeds': 0, 'tempo': 120, 'subdivision': 4, 'note': 36}
+
+
+@dataclass
+class Job:
+    index: int
+    pattern: str
+    onsets: int
+    length: int
+    rotation: int
+    amount: int
+    algorithm: str
+    bars: int
+    seed: int
+    tempo: int
+    subdivision: int
+    note: int
+
+
+def expand(value) -> list:
+    if isinstance(value, dict):
+        return list(range(value['start'], value['stop'], value.get('step', 1)))
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def sweep(spec: dict):
+    unknown = set(spec) - set(SWEEP_KEYS)
+    if unknown:
+        raise ValueError('unknown sweep parameters: ' + ', '.join(sorted(unknown)))
+    if 'patterns' not in spec:
+        raise ValueError('the sweep spec needs at least one base pattern in "patterns"')
+    for name in expand(spec.get('algorithm', DEFAULTS['algorithm'])):
+        if name not in morphers():
+            raise ValueError('unknown algorithm: ' + str(name))
+    for pattern in expand(spec['patterns']):
+        if not isinstance(pattern, str) or not pattern or set(pattern) - {'0', '1'}:
+            raise ValueError('base patterns must be non-empty strings of 0 and 1: ' + repr(pattern))
+
+    values = [expand(spec.get(key, DEFAULTS.get(key))) for key in SWEEP_KEYS]
+    jobs = (params for params in itertools.product(*values)
+            # Skips Euclidean parameters the GUI would not allow
+            if params[1] <= params[2] and params[3] < max(params[2], 1))
+    for index, params in enumerate(jobs):
+        yield Job(index, *params)
+
+
+# Cache of the worker process, set up by init_worker
+_cache: RenderCache = None
+
+
+def render(job: Job, out: str) -> dict:
+    metrics.reset()
+    filename = f'{job.index:06d}.mid'
+    if _cache is None:
+        entry = render_job(job, os.path.join(out, filename))
+    else:
+        params = asdict(job)
+        del params['index']
+        key = _cache.key('render', params, morphers()[job.algorithm].cache_id())
+        data, stats = _cache.get(key), _cache.get(key + '-stats')
+        if data is None or stats is None:
+            entry = render_job(job, os.path.join(out, filename))
+            with open(os.path.join(out, filename), 'rb') as f:
+                _cache.put(key, f.read())
+            _cache.put(key + '-stats', json.dumps(entry).encode())
+        else:
+            with open(os.path.join(out, filename), 'wb') as f:
+                f.write(data)
+            entry = json.loads(stats)
+            metrics.count('cache.hits')
+    entry = {'file': filename, **asdict(job), **entry}
+    if metrics.enabled:
+        entry['metrics'] = metrics.snapshot()
+    return entry
+
+
+def render_job(job: Job, path: str) -> dict:
+    session = Session(seed=job.seed)
+    v = session.generate(GenerateParams(sequence=job.pattern, onsets=job.onsets, length=job.length,
+                                        rotation=job.rotation, amount=job.amount, algorithm=job.algorithm,
+                                        note=job.note, tempo=job.tempo, subdivision=job.subdivision,
+                                        bars=job.bars))
+    session.save(path)
+    return {'steps': v.length(), 'onset_count': int(v.onsets().sum())}
+
+
+def init_worker(euc_table: str = None, collect_metrics: bool = False, cache: str = None,
+                cache_size: int = 1 << 30):
+    global _cache
+    if collect_metrics:
+        metrics.enable()
+    if cache is not None:
+        _cache = RenderCache(cache, cache_size)
+        use_disk_cache(_cache)
+    if euc_table is not None:
+        use_euc_table(load_euc_table(euc_table))
+
+
+def run(spec: dict, out: str, workers: int = None, chunksize: int = None, euc_table: str = None,
+        collect_metrics: bool = False, cache: str = None, cache_size: int = 1 << 30) -> int:
+    os.makedirs(out, exist_ok=True)
+    jobs = list(sweep(spec))
+    workers = workers or os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, len(jobs) // (workers * 4))
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(euc_table, collect_metrics, cache, cache_size)) as executor, \
+            open(os.path.join(out, 'manifest.jsonl'), 'w') as manifest:
+        for entry in executor.map(partial(render, out=out), jobs, chunksize=chunksize):
+            manifest.write(json.dumps(entry) + '\n')
+    return len(jobs)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m seqmorph.batch',
+                                     description='Render a parameter sweep of morphed rhythms to MIDI files.')
+    parser.add_argument('spec', help='path to a JSON sweep spec')
+    parser.add_argument('-o', '--out', default='renders', help='output directory (default: renders)')
+    parser.add_argument('-j', '--workers', type=int, default=None, help='worker processes (default: CPU count)')
+    parser.add_argument('--chunksize', type=int, default=None, help='jobs per submitted task')
+    parser.add_argument('--euc-table', default=None, help='precomputed Euclidean table to memory-map (seq.table)')
+    parser.add_argument('--metrics', action='store_true',
+                        help='record counters and timing spans of every job in the manifest')
+    parser.add_argument('--cache', default=None, help='directory of a render cache shared between runs')
+    parser.add_argument('--cache-size', type=int, default=1024, help='render cache size limit in MiB (default: 1024)')
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = json.load(f)
+    count = run(spec, args.out, args.workers, args.chunksize, args.euc_table, args.metrics, args.cache,
+                args.cache_size << 20)
+    print('Rendered ' + str(count) + ' files to ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import numpy as np
+
+from seq import StepSequence
+from .eucmorpher import EucMorpher
+
+
+class HyperperiodCursor:
+    # Position in the hyperperiod of a morpher with random access by bar. Bars are cut from the
+    # probability table with periodic slices, so seeking and rendering any range of bars takes constant
+    # time per bar. state() returns the position and random generator state as plain JSON data, so a
+    # long render can be checkpointed and resumed in another process with restore().
+    def __init__(self, morpher: EucMorpher, position: int = 0, seed=None):
+        self._morpher = morpher
+        self._bar_length = morpher.bar_length()
+        self._period = len(morpher.prob_steps())
+        self._position = position % self._period
+        self._rng = np.random.default_rng(seed)
+
+    def tell(self) -> int:
+        return self._position
+
+    def bar(self) -> int:
+        # Index of the bar at the cursor, counted from the start of the hyperperiod
+        return self._position // self._bar_length
+
+    def bars_per_period(self) -> int:
+        return -(-self._period // self._bar_length)
+
+    def seek(self, bar: int):
+        self._position = bar * self._bar_length % self._period
+
+    def probabilities(self, num_bars: int = 1) -> np.ndarray:
+        # Step probabilities of the next num_bars bars as an array of shape (bars, steps), without moving
+        return (self._morpher.prob_steps().window(self._position, num_bars * self._bar_length)
+                .reshape(num_bars, self._bar_length))
+
+    def read(self, num_bars: int = 1) -> StepSequence:
+        if num_bars < 0:
+            raise ValueError('cannot read a negative number of bars')
+        if num_bars == 0:
+            return self._morpher.make_sequence(np.zeros(0, dtype=bool), np.zeros(0, dtype=np.uint8))
+        v = self._morpher.generate(num_bars, self._position, self._rng)
+        self._position = (self._position + v.length()) % self._period
+        return v
+
+    def render(self, start: int, stop: int) -> StepSequence:
+        # Bars start..stop-1 counted from the start of the hyperperiod, leaving the cursor after them
+        if stop < start:
+            raise ValueError('the bar range ends before it starts')
+        self.seek(start)
+        return self.read(stop - start)
+
+    def state(self) -> dict:
+        return {'position': self._position, 'bar_length': self._bar_length, 'period': self._period,
+                'rng': self._rng.bit_generator.state}
+
+    @classmethod
+    def restore(cls, morpher: EucMorpher, state: dict):
+        cursor = cls(morpher, state['position'])
+        if (cursor._bar_length, cursor._period) != (state['bar_length'], state['period']):
+            raise ValueError('the saved position belongs to a hyperperiod of different length')
+        bit_generator = getattr(np.random, state['rng']['bit_generator'])()
+        bit_generator.state = state['rng']
+        cursor._rng = np.random.Generator(bit_generator)
+        return cursor
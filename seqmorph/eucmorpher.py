@@ -1,33 +1,143 @@
 import copy
+from collections.abc import Iterator
 
-from seq import euc
-from seq import StepSequence
-from .probsteps import ProbStepAlg
-from random import random
+import numpy as np
+
+from seq import euc, LRUCache
+from seq import StepSequence, metrics
+from .probsteps import ProbStepAlg, PeriodicProbSteps, MorphInputs, hyperperiod
+from .expression import Expression
+from .stats import MorphStats, bar_statistics
+
+prob_steps_cache = LRUCache(128)
+
+# Hyperperiods longer than this many steps are not materialized, their probabilities are computed on demand
+MAX_PERIOD = 1 << 20
+
+# On-disk cache of probability tables shared between processes, see RenderCache, installed with use_disk_cache
+_disk_cache = None
+
+
+def use_disk_cache(cache):
+    global _disk_cache
+    _disk_cache = cache
+
+
+def check_materialized(prob_steps):
+    # Whole hyperperiods above MAX_PERIOD are only generated bar by bar, never in one piece
+    if isinstance(prob_steps, PeriodicProbSteps):
+        raise ValueError('the hyperperiod of ' + str(len(prob_steps)) + ' steps is too long to generate at once, '
+                         'generate it in bars (iter_bars)')
 
 
 class EucMorpher:
-    def __init__(self, s: StepSequence, onsets, subdivisions, rotation, randomness, algorithm: ProbStepAlg):
+    def __init__(self, s: StepSequence, onsets, subdivisions, rotation, randomness, algorithm: ProbStepAlg,
+                 seed=None, max_period: int = None, expression: Expression = None):
         self._algorithm = algorithm
+        self._expression = expression
         self._s = copy.deepcopy(s)
         self._e = (StepSequence(note=s.note(), default_velocity=s.default_velocity(),
                                 tempo=s.tempo(), subdivision=s.subdivision())
                    .init_from_list(euc(onsets, subdivisions, rotation)))
-        self._prob_steps = algorithm.generate_prob_steps(self._s, self._e, randomness)
+        key = (self._s.onsets().tobytes(), self._s.length(), onsets, subdivisions, rotation, randomness,
+               algorithm)
+        if hyperperiod(self._s, self._e) > (MAX_PERIOD if max_period is None else max_period):
+            self._prob_steps = prob_steps_cache.get(
+                key + ('periodic',), lambda: PeriodicProbSteps(self._s, self._e, randomness, algorithm))
+        else:
+            self._prob_steps = prob_steps_cache.get(key, lambda: self._compute_prob_steps(key, randomness).freeze())
+        self._rng = np.random.default_rng(seed)
+
+    def _compute_prob_steps(self, key: tuple, randomness):
+        def compute():
+            return self._algorithm.generate_prob_steps(self._s, self._e, randomness)
+        if _disk_cache is None:
+            return compute()
+        return _disk_cache.prob_steps(_disk_cache.key('prob_steps', key[0].hex(), *key[1:-1],
+                                                      self._algorithm.cache_id()), compute)
 
     def prob_steps(self):
         return self._prob_steps
 
-    def generate(self, num_bars: int = None, start_pos: int = 0) -> StepSequence:
+    def bar_length(self) -> int:
+        return self._s.length()
+
+    def hyperperiod_bars(self) -> int:
+        # Bars needed to cover the hyperperiod, which is not a whole number of bars when the base has no onsets
+        return -(-len(self._prob_steps) // self._s.length())
+
+    def statistics(self, num_bars: int = None, start_pos: int = 0) -> MorphStats:
+        # Exact onset statistics of the bars generate would sample, see seqmorph.stats
+        return bar_statistics(self._prob_steps, self._s.length(), num_bars, start_pos)
+
+    def sample(self, num_bars: int = None, start_pos: int = 0, variations: int = 1, rng=None) -> np.ndarray:
+        # Draws every step of every variation at once, returns an onset mask of shape (variations, length)
+        return self.sample_steps(num_bars, start_pos, variations, rng)[0]
+
+    def sample_steps(self, num_bars: int = None, start_pos: int = 0, variations: int = 1,
+                     rng=None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Onsets, velocities and micro-timing offsets of every step of every variation, drawn in one pass
         if num_bars is None or num_bars <= 0:
+            check_materialized(self._prob_steps)
             length = len(self._prob_steps)
         else:
             length = self._s.length() * num_bars
+        rng = self._rng if rng is None else np.random.default_rng(rng)
+
+        metrics.count('generate.steps', length * variations)
+        return self.draw(self._prob_steps.window(start_pos, length), start_pos, variations, rng)
+
+    def draw(self, p: np.ndarray, start_pos: int = 0, variations: int = 1,
+             rng=None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Samples the steps from start_pos with the onset probabilities p
+        rng = self._rng if rng is None else np.random.default_rng(rng)
+        onsets = rng.random((variations, len(p))) < p
+        if self._expression is None:
+            return (onsets, np.where(onsets, self._s.default_velocity(), 0).astype(np.uint8),
+                    np.zeros(onsets.shape, dtype=np.float32))
+        return self._expression.sample(self._s, p, start_pos, onsets, rng)
+
+    @metrics.timed('EucMorpher.generate')
+    def generate(self, num_bars: int = None, start_pos: int = 0, rng=None) -> StepSequence:
+        return self.generate_many(num_bars, 1, start_pos, rng)[0]
+
+    def generate_many(self, num_bars: int = None, variations: int = 1, start_pos: int = 0,
+                      rng=None) -> list[StepSequence]:
+        return [self.make_sequence(*arrays)
+                for arrays in zip(*self.sample_steps(num_bars, start_pos, variations, rng))]
+
+    def automation_table(self, amounts: np.ndarray, start_pos: int = 0) -> np.ndarray:
+        # Probabilities of len(amounts) bars from start_pos with bar i morphed by amounts[i], shape (bars, steps).
+        # The rules are evaluated once on the markings of all bars, with one morph amount per row.
+        num_bars, bar_length = len(amounts), self._s.length()
+        m = MorphInputs(*(self._prob_steps.properties_window(start_pos + shift, num_bars * bar_length)
+                          .reshape(num_bars, bar_length) for shift in (0, -1, 1)))
+        rp = np.clip(np.asarray(amounts, dtype=np.float64) / 100, 0, 1)[:, None]
+        return np.broadcast_to(self._algorithm.probabilities(m, rp), (num_bars, bar_length))
+
+    def generate_automated(self, amounts: np.ndarray, start_pos: int = 0, rng=None) -> StepSequence:
+        # One bar per amount, all sampled in one pass, see seqmorph.automation for curves
+        p = self.automation_table(amounts, start_pos).ravel()
+        metrics.count('generate.steps', len(p))
+        return self.make_sequence(*(a[0] for a in self.draw(p, start_pos, 1, rng)))
+
+    def make_sequence(self, onsets: np.ndarray, velocities: np.ndarray, offsets: np.ndarray = None) -> StepSequence:
+        return (StepSequence(note=self._s.note(), default_velocity=self._s.default_velocity(),
+                             tempo=self._s.tempo(), subdivision=self._s.subdivision())
+                .init_from_arrays(onsets, velocities, offsets))
 
-        v = StepSequence(length=length, note=self._s.note(), default_velocity=self._s.default_velocity(),
-                         tempo=self._s.tempo(), subdivision=self._s.subdivision())
-        for i in range(v.length()):
-            p = self._prob_steps[(i+start_pos) % len(self._prob_steps)].probability
-            if random() < p:
-                v.set_step(i)
-        return v
+    def iter_bars(self, num_bars: int = None, start_pos: int = 0, bars_per_chunk: int = 64,
+                  rng=None) -> Iterator[StepSequence]:
+        # Yields bars one at a time, endlessly if num_bars is None, sampling bars_per_chunk bars per pass
+        rng = self._rng if rng is None else np.random.default_rng(rng)
+        bar_length = self._s.length()
+        pos = start_pos
+        remaining = num_bars
+        while remaining is None or remaining > 0:
+            count = bars_per_chunk if remaining is None else min(bars_per_chunk, remaining)
+            chunk = self.generate(count, pos, rng)
+            for i in range(count):
+                yield chunk[i * bar_length:(i + 1) * bar_length]
+            pos = (pos + count * bar_length) % len(self._prob_steps)
+            if remaining is not None:
+                remaining -= count
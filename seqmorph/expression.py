@@ -0,0 +1,40 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from seq import StepSequence
+
+
+@dataclass(frozen=True)
+class Expression:
+    # Velocity and micro-timing of the morphed steps, drawn in the same pass as the onsets.
+    # Velocities are normally distributed around the base sequence's velocity (the default velocity
+    # for steps only the Euclidean rhythm has), scaled down towards the onset probability by dynamics
+    # so unlikely ghost notes are quieter. Timing offsets are in steps: swing delays every second
+    # step of the bar and humanize is the spread of a normal distribution around it.
+    velocity_spread: float = 0.0
+    dynamics: float = 0.0
+    swing: float = 0.0
+    humanize: float = 0.0
+
+    def distributions(self, s: StepSequence, probability: np.ndarray, start: int) -> tuple[np.ndarray, np.ndarray]:
+        # Mean velocity and mean timing offset of each step start..start+len(probability)
+        index = (start + np.arange(len(probability))) % s.length()
+        velocity = np.where(s.onsets()[index], s.velocities()[index], s.default_velocity())
+        velocity = velocity * (1 - self.dynamics + self.dynamics * probability)
+        offset = np.where(index % 2 == 1, self.swing, 0.0)
+        return velocity, offset
+
+    def sample(self, s: StepSequence, probability: np.ndarray, start: int, onsets: np.ndarray,
+               rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # Velocities and offsets for the onset mask of shape (variations, length), zero at rests
+        velocity, offset = self.distributions(s, probability, start)
+        velocity = np.broadcast_to(velocity, onsets.shape)
+        offset = np.broadcast_to(offset, onsets.shape)
+        if self.velocity_spread:
+            velocity = velocity + self.velocity_spread * rng.standard_normal(onsets.shape)
+        if self.humanize:
+            offset = offset + self.humanize * rng.standard_normal(onsets.shape)
+        velocities = np.where(onsets, np.clip(np.rint(velocity), 1, 127), 0).astype(np.uint8)
+        offsets = np.where(onsets, np.clip(offset, -0.5, 0.5), 0).astype(np.float32)
+        return onsets, velocities, offsets
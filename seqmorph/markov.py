@@ -0,0 +1,69 @@
+from collections.abc import Iterator
+
+import numpy as np
+
+from seq import StepSequence
+from .eucmorpher import EucMorpher, check_materialized
+
+
+class MarkovMorpher:
+    # Generates bar by bar with each bar conditioned on the bars played before it. The state is a trace
+    # of one value per step of the bar, a moving average of the realized onsets that is updated after
+    # every bar, so any number of bars takes linear time and constant memory.
+    #
+    # feedback > 0 pulls the probabilities towards the trace (patterns settle and repeat, with 1 and rate 1
+    # the first bar loops), feedback < 0 pushes away from it (avoids repeating what was just played),
+    # 0 samples every bar independently. rate is how quickly the trace follows new bars.
+    def __init__(self, morpher: EucMorpher, feedback: float = 0.5, rate: float = 0.5, trace: np.ndarray = None):
+        self._morpher = morpher
+        self._feedback = feedback
+        self._rate = rate
+        self._trace = None if trace is None else np.array(trace, dtype=np.float64)
+        if self._trace is not None and not len(self._trace) == morpher.bar_length():
+            raise ValueError('the trace must have one value per step of the bar')
+
+    def morpher(self) -> EucMorpher:
+        return self._morpher
+
+    def trace(self) -> np.ndarray:
+        return self._trace
+
+    def reset(self):
+        self._trace = None
+
+    def _sample_bar(self, pos: int, rng) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        target = self._morpher.prob_steps().window(pos, self._morpher.bar_length())
+        if self._trace is None:
+            self._trace = target.copy()
+        p = np.clip(target + self._feedback * (self._trace - target), 0, 1)
+        onsets, velocities, offsets = self._morpher.draw(p, pos, 1, rng)
+        self._trace += self._rate * (onsets[0] - self._trace)
+        return onsets[0], velocities[0], offsets[0]
+
+    def iter_bars(self, num_bars: int = None, start_pos: int = 0, rng=None) -> Iterator[StepSequence]:
+        # Yields bars one at a time, endlessly if num_bars is None
+        rng = None if rng is None else np.random.default_rng(rng)
+        bar_length = self._morpher.bar_length()
+        period = len(self._morpher.prob_steps())
+        pos = start_pos
+        played = 0
+        while num_bars is None or played < num_bars:
+            yield self._morpher.make_sequence(*self._sample_bar(pos, rng))
+            pos = (pos + bar_length) % period
+            played += 1
+
+    def generate(self, num_bars: int = None, start_pos: int = 0, rng=None) -> StepSequence:
+        # Generates num_bars bars, or one hyperperiod if num_bars is None or 0 like EucMorpher.generate
+        rng = None if rng is None else np.random.default_rng(rng)
+        bar_length = self._morpher.bar_length()
+        period = len(self._morpher.prob_steps())
+        if num_bars is None or num_bars <= 0:
+            check_materialized(self._morpher.prob_steps())
+            num_bars = self._morpher.hyperperiod_bars()
+        onsets = np.empty((num_bars, bar_length), dtype=bool)
+        velocities = np.empty((num_bars, bar_length), dtype=np.uint8)
+        offsets = np.empty((num_bars, bar_length), dtype=np.float32)
+        for bar in range(num_bars):
+            onsets[bar], velocities[bar], offsets[bar] = self._sample_bar((start_pos + bar * bar_length) % period,
+                                                                          rng)
+        return self._morpher.make_sequence(onsets.ravel(), velocities.ravel(), offsets.ravel())
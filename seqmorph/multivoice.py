@@ -0,0 +1,57 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from seq import StepSequence
+from .eucmorpher import EucMorpher
+from .probsteps import ProbStepAlg
+
+
+@dataclass
+class Voice:
+    sequence: StepSequence
+    onsets: int
+    length: int
+    rotation: int
+    amount: int
+    algorithm: ProbStepAlg
+
+
+class MultiVoiceMorpher:
+    # Morphs several voices (kick, snare, hats, ...) together. Each voice has its own base pattern,
+    # Euclidean rhythm, morph amount, algorithm and note, and all voices are sampled in one pass.
+    def __init__(self, voices: list[Voice], seed=None):
+        self._voices = voices
+        self._morphers = [EucMorpher(v.sequence, v.onsets, v.length, v.rotation, v.amount, v.algorithm)
+                          for v in voices]
+        self._rng = np.random.default_rng(seed)
+
+    def morphers(self) -> list[EucMorpher]:
+        return self._morphers
+
+    def lengths(self, num_bars: int = None) -> np.ndarray:
+        if num_bars is None or num_bars <= 0:
+            return np.array([len(m.prob_steps()) for m in self._morphers])
+        return np.array([v.sequence.length() * num_bars for v in self._voices])
+
+    def prob_table(self, num_bars: int = None, start_pos=0) -> np.ndarray:
+        # Probabilities of every voice stacked into a (voices, steps) array, zero padded past the end
+        # of voices with shorter bars
+        lengths = self.lengths(num_bars)
+        start_pos = np.broadcast_to(start_pos, len(self._voices))
+        table = np.zeros((len(self._voices), lengths.max(initial=0)))
+        for row, m, length, start in zip(table, self._morphers, lengths, start_pos):
+            row[:length] = m.prob_steps().window(int(start), int(length))
+        return table
+
+    def sample(self, num_bars: int = None, start_pos=0, rng=None) -> np.ndarray:
+        rng = self._rng if rng is None else np.random.default_rng(rng)
+        table = self.prob_table(num_bars, start_pos)
+        return rng.random(table.shape) < table
+
+    def generate(self, num_bars: int = None, start_pos=0, rng=None) -> list[StepSequence]:
+        masks = self.sample(num_bars, start_pos, rng)
+        return [StepSequence(note=v.sequence.note(), default_velocity=v.sequence.default_velocity(),
+                             tempo=v.sequence.tempo(), subdivision=v.sequence.subdivision())
+                .init_from_list(mask[:length])
+                for v, mask, length in zip(self._voices, masks, self.lengths(num_bars))]
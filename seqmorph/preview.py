@@ -0,0 +1,30 @@
+import numpy as np
+
+from seq import StepSequence, LRUCache, euc
+from .probsteps import ProbStepAlg, ProbStepArray, mark_prob_steps
+
+# Markings of the hyperperiod for the latest (base rhythm, Euclidean rhythm) inputs, so that moving
+# the morph amount or switching algorithm only reapplies the probability rules
+marks_cache = LRUCache(64)
+
+
+def preview_prob_steps(sequence: str, onsets: int, length: int, rotation: int, amount: int,
+                       algorithm: ProbStepAlg) -> ProbStepArray | None:
+    # Returns None while the inputs cannot be morphed, e.g. while the user is typing
+    try:
+        pattern = [int(x) for x in sequence]
+    except ValueError:
+        return None
+    s = StepSequence().init_from_list(pattern)
+    e = StepSequence().init_from_list(euc(onsets, length, rotation))
+    if not s.has_onset() and not e.has_onset():
+        return None
+    props = marks_cache.get((s.onsets().tobytes(), s.length(), onsets, length, rotation),
+                            lambda: mark_prob_steps(s, e))
+    return algorithm.from_marks(props, amount)
+
+
+def probability_string(prob_steps: ProbStepArray, limit: int = 256) -> str:
+    # One digit per step, 0 for never and 9 for always
+    digits = np.rint(prob_steps.probability[:limit] * 9).astype(np.uint8) + ord('0')
+    return digits.tobytes().decode()
@@ -1,8 +1,16 @@
+import math
 from dataclasses import dataclass, field
 from abc import abstractmethod, ABC
+from functools import cached_property
+from importlib.metadata import entry_points
 
 import numpy as np
 from seq.stepseq import StepSequence
+from seq.metrics import metrics
+
+# Bit flags marking which inputted sequence has an onset at a probability step
+S = 1
+E = 2
 
 
 @dataclass
@@ -24,183 +32,245 @@ class ProbStep:
         return s + '\n'.join(seq)
 
 
+@dataclass(eq=False)
+class ProbStepArray:
+    probability: np.ndarray
+    properties: np.ndarray
+    labels: tuple = ('s', 'e')
+
+    def onsets(self) -> np.ndarray:
+        return self.properties != 0
+
+    def freeze(self):
+        # Cached tables are shared between morphers and must not be modified in place
+        self.probability.flags.writeable = False
+        self.properties.flags.writeable = False
+        return self
+
+    def __len__(self):
+        return len(self.probability)
+
+    def __getitem__(self, index: int) -> ProbStep:
+        index = range(len(self))[index]
+        props = int(self.properties[index])
+        return ProbStep(onset=props != 0, probability=float(self.probability[index]),
+                        properties={label for bit, label in zip((S, E), self.labels) if props & bit})
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def window(self, start: int, length: int) -> np.ndarray:
+        # Probabilities of the steps start..start+length, wrapping around the hyperperiod
+        return wrap(self.probability, start, length)
+
+    def properties_window(self, start: int, length: int) -> np.ndarray:
+        return wrap(self.properties, start, length)
+
+
+def wrap(data: np.ndarray, start: int, length: int) -> np.ndarray:
+    # Periodic slice of data, a view without copying when it does not wrap around the end. Only the
+    # steps of the slice are copied otherwise, so the cost does not depend on the length of data.
+    start %= len(data)
+    if start + length <= len(data):
+        return data[start:start + length]
+    if start + length <= 2 * len(data):
+        return np.concatenate((data[start:], data[:start + length - len(data)]))
+    return np.take(data, np.arange(start, start + length), mode='wrap')
+
+
+@dataclass(eq=False)
+class MorphInputs:
+    # Markings shared by every algorithm's rules: each step's S/E flags and those of its neighbours.
+    # The derived masks are computed on first use and reused by all algorithms evaluated on the same inputs.
+    props: np.ndarray
+    prev: np.ndarray
+    nxt: np.ndarray
+
+    @classmethod
+    def from_marks(cls, props: np.ndarray):
+        return cls(props, np.roll(props, 1), np.roll(props, -1))
+
+    @cached_property
+    def onset(self) -> np.ndarray:
+        return self.props != 0
+
+    @cached_property
+    def rest(self) -> np.ndarray:
+        return self.props == 0
+
+    @cached_property
+    def base(self) -> np.ndarray:
+        return (self.props & S) != 0
+
+    @cached_property
+    def extra(self) -> np.ndarray:
+        return (self.props & E) != 0
+
+    @cached_property
+    def both(self) -> np.ndarray:
+        return self.props == S | E
+
+    @cached_property
+    def adj(self) -> np.ndarray:
+        return (self.prev != 0) | (self.nxt != 0)
+
+    @cached_property
+    def adj_base(self) -> np.ndarray:
+        return ((self.prev | self.nxt) & S) != 0
+
+    @cached_property
+    def adj_both(self) -> np.ndarray:
+        return (self.prev == S | E) | (self.nxt == S | E)
+
+
 class ProbStepAlg(ABC):
+    labels = ('s', 'e')
+    # Bumped whenever the rules change, so tables cached on disk by older versions are not reused
+    version = 1
+
+    def cache_id(self) -> str:
+        # Identity of the rules in caches shared between processes. Algorithms configured with parameters
+        # must include them, so differently configured instances do not share cached tables.
+        return type(self).__module__ + '.' + type(self).__qualname__ + ':' + str(self.version)
+
+    @metrics.timed('generate_prob_steps')
+    def generate_prob_steps(self, s: StepSequence, e: StepSequence, r: int) -> ProbStepArray:
+        props = mark_prob_steps(s, e)
+        metrics.count('prob_steps.lcm_steps', len(props))
+        return self.from_marks(props, r)
+
+    def from_marks(self, props: np.ndarray, r: int) -> ProbStepArray:
+        return self.from_inputs(MorphInputs.from_marks(props), r)
+
+    def from_inputs(self, m: MorphInputs, r: int) -> ProbStepArray:
+        return ProbStepArray(self.probabilities(m, np.clip(r/100, 0, 1)), m.props, self.labels)
+
     @abstractmethod
-    def generate_prob_steps(self, s: StepSequence, e: StepSequence, r: int) -> list[ProbStep]:
+    def probabilities(self, m: MorphInputs, rp) -> np.ndarray:
+        # Vectorized rules giving the probability of each step from the shared markings and the morph
+        # amount rp in 0..1
         pass
 
 
+# Registered algorithms by name, extended by the "seqmorph.algorithms" entry point group
+_registry: dict[str, ProbStepAlg] = {}
+_entry_points_loaded = False
+
+
+def register(name: str = None):
+    def decorator(cls):
+        _registry[name or cls.__name__] = cls()
+        return cls
+    return decorator
+
+
+def morphers() -> dict[str, ProbStepAlg]:
+    global _entry_points_loaded
+    if not _entry_points_loaded:
+        _entry_points_loaded = True
+        for ep in entry_points(group='seqmorph.algorithms'):
+            algorithm = ep.load()
+            # Plugins that already registered themselves with @register() are not listed twice
+            if any(alg is algorithm or type(alg) is algorithm for alg in _registry.values()):
+                continue
+            _registry.setdefault(ep.name, algorithm() if isinstance(algorithm, type) else algorithm)
+    return dict(sorted(_registry.items()))
+
+
+def evaluate_all(s: StepSequence, e: StepSequence, r: int, algorithms: dict = None) -> dict[str, ProbStepArray]:
+    # Marks the inputs once and applies the rules of every algorithm to the same markings
+    m = MorphInputs.from_marks(mark_prob_steps(s, e))
+    return {name: alg.from_inputs(m, r) for name, alg in (algorithms or morphers()).items()}
+
+
+def hyperperiod(s: StepSequence, e: StepSequence) -> int:
+    return math.lcm(*[seq.length() for seq in (s, e) if seq.has_onset()])
+
+
+def mark_prob_steps(s: StepSequence, e: StepSequence) -> np.ndarray:
+    # Marks the probability steps that correspond to an onset from the inputted sequences,
+    # tiled over the hyperperiod of the sequences that have any onsets
+    data = [(seq, bit) for seq, bit in ((s, S), (e, E)) if seq.has_onset()]
+    length = np.lcm.reduce([seq.length() for seq, _ in data])
+    props = np.zeros(length, dtype=np.uint8)
+    for seq, bit in data:
+        props[np.resize(seq.onsets(), length)] |= bit
+    return props
+
+
+class PeriodicProbSteps:
+    # Lazy probability steps over the hyperperiod, computed on demand from the two inputted sequences,
+    # so memory is proportional to the sequences and not to their LCM
+    def __init__(self, s: StepSequence, e: StepSequence, r: int, algorithm: ProbStepAlg):
+        self._data = [(seq.onsets().copy(), bit) for seq, bit in ((s, S), (e, E)) if seq.has_onset()]
+        self._length = hyperperiod(s, e)
+        self._rp = np.clip(r/100, 0, 1)
+        self._algorithm = algorithm
+
+    def __len__(self):
+        return self._length
+
+    def properties_at(self, index: np.ndarray) -> np.ndarray:
+        props = np.zeros(len(index), dtype=np.uint8)
+        for onsets, bit in self._data:
+            props[onsets[index % len(onsets)]] |= bit
+        return props
+
+    def probabilities_at(self, index: np.ndarray) -> np.ndarray:
+        index = np.asarray(index, dtype=np.int64) % self._length
+        m = MorphInputs(self.properties_at(index), self.properties_at(index - 1), self.properties_at(index + 1))
+        return self._algorithm.probabilities(m, self._rp)
+
+    def window(self, start: int, length: int) -> np.ndarray:
+        return self.probabilities_at(np.arange(start, start + length, dtype=np.int64))
+
+    def properties_window(self, start: int, length: int) -> np.ndarray:
+        return self.properties_at(np.arange(start, start + length, dtype=np.int64) % self._length)
+
+    def __getitem__(self, index: int) -> ProbStep:
+        index = range(len(self))[index]
+        return ProbStepArray(self.probabilities_at([index]), self.properties_at(np.array([index])),
+                             self._algorithm.labels)[0]
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+
+@register()
 class SimpleProbStepAlg(ProbStepAlg):
-    def generate_prob_steps(self, s: StepSequence, e: StepSequence, r: int) -> list[ProbStep]:
-        rp = np.clip(r/100, 0, 1)
-        seqs = [seq.sequence() for seq in (s, e) if seq.has_onset()]
-        length = np.lcm.reduce([len(item) for item in seqs])
-        prob_steps = []
-
-        # Adds and marks the probability steps that correspond to an onset from the inputted sequences
-        for i in range(length):
-            if any(seq[i % len(seq)].onset for seq in seqs):
-                prob_steps.append(ProbStep(onset=True))
-            else:
-                prob_steps.append(ProbStep())
-
-        # Calculates appropriate probabilities
-        for i in range(length):
-            if not prob_steps[i].onset:
-                if prob_steps[i-1].onset or prob_steps[(i+1) % length].onset:
-                    prob_steps[i].probability = rp/2
-            else:
-                prob_steps[i].probability = 1 - rp/2
-
-        return prob_steps
+    labels = ()
+
+    def probabilities(self, m: MorphInputs, rp) -> np.ndarray:
+        return np.select([m.onset, m.adj], [1 - rp/2, rp/2], 0.0)
 
 
+@register()
 class SimpleProbStepAlgV2(ProbStepAlg):
-    def generate_prob_steps(self, s: StepSequence, e: StepSequence, r: int) -> list[ProbStep]:
-        rp = np.clip(r/100, 0, 1)
-        data = [seq.sequence() for seq in (s, e) if seq.has_onset()]
-        length = np.lcm.reduce([len(item) for item in data])
-        prob_steps = []
-
-        # Adds and marks the probability steps that correspond to an onset from the inputted sequences
-        for i in range(length):
-            prob_steps.append(ProbStep())
-            for seq in data:
-                if seq[i % len(seq)].onset:
-                    prob_steps[i].onset = True
-                    if seq is s.sequence():
-                        prob_steps[i].properties.add('base')
-                    if seq is e.sequence():
-                        prob_steps[i].properties.add('extra')
-
-        for i in range(length):
-            if not prob_steps[i].onset:
-                adj = (prob_steps[i-1], prob_steps[(i+1) % length])
-                if any(step.onset for step in adj):
-                    if any('base' in step.properties for step in adj):
-                        prob_steps[i].probability = rp/4
-                    else:
-                        prob_steps[i].probability = rp/2
-            else:
-                if 'base' in prob_steps[i].properties:
-                    prob_steps[i].probability = 1 - rp/4
-                else:
-                    prob_steps[i].probability = 1 - rp/2
-
-        return prob_steps
+    labels = ('base', 'extra')
+
+    def probabilities(self, m: MorphInputs, rp) -> np.ndarray:
+        return np.select([m.base, m.onset, m.adj_base, m.adj], [1 - rp/4, 1 - rp/2, rp/4, rp/2], 0.0)
 
 
+@register()
 class MegaMorphV1(ProbStepAlg):
-    def generate_prob_steps(self, s: StepSequence, e: StepSequence, r: int) -> list[ProbStep]:
-        rp = np.clip(r/100, 0, 1)
-        data = [seq.sequence() for seq in (s, e) if seq.has_onset()]
-        length = np.lcm.reduce([len(item) for item in data])
-        prob_steps = []
-
-        # Adds and marks the probability steps that correspond to an onset from the inputted sequences
-        for i in range(length):
-            prob_steps.append(ProbStep())
-            for seq in data:
-                if seq[i % len(seq)].onset:
-                    prob_steps[i].onset = True
-                    if seq is s.sequence():
-                        prob_steps[i].properties.add('s')
-                    if seq is e.sequence():
-                        prob_steps[i].properties.add('e')
-
-        for i in range(length):
-            adj = (prob_steps[i - 1], prob_steps[(i + 1) % length])
-            if not prob_steps[i].onset:
-                if any('s' in step.properties and 'e' in step.properties for step in adj):
-                    prob_steps[i].probability = rp/4
-                elif any('s' in step.properties for step in adj):
-                    prob_steps[i].probability = rp/2
-            else:
-                if 's' in prob_steps[i].properties and 'e' in prob_steps[i].properties:
-                    prob_steps[i].probability = 1 - rp/4
-                elif 's' in prob_steps[i].properties:
-                    prob_steps[i].probability = 1 - rp/2
-                elif 'e' in prob_steps[i].properties:
-                    prob_steps[i].probability = rp
-
-        return prob_steps
+    def probabilities(self, m: MorphInputs, rp) -> np.ndarray:
+        return np.select([m.both, m.base, m.extra, m.rest & m.adj_both, m.rest & m.adj_base],
+                         [1 - rp/4, 1 - rp/2, rp, rp/4, rp/2], 0.0)
 
 
+@register()
 class DirectMorph100(ProbStepAlg):
-    def generate_prob_steps(self, s: StepSequence, e: StepSequence, r: int) -> list[ProbStep]:
-        rp = np.clip(r/100, 0, 1)
-        data = [seq.sequence() for seq in (s, e) if seq.has_onset()]
-        length = np.lcm.reduce([len(item) for item in data])
-        prob_steps = []
-
-        # Adds and marks the probability steps that correspond to an onset from the inputted sequences
-        for i in range(length):
-            prob_steps.append(ProbStep())
-            for seq in data:
-                if seq[i % len(seq)].onset:
-                    prob_steps[i].onset = True
-                    if seq is s.sequence():
-                        prob_steps[i].properties.add('s')
-                    if seq is e.sequence():
-                        prob_steps[i].properties.add('e')
-
-        # Assigns probabilities to the probability steps
-        for i in range(length):
-            if prob_steps[i].onset:
-                if 's' in prob_steps[i].properties and 'e' in prob_steps[i].properties:
-                    prob_steps[i].probability = max(1-rp, rp)
-                elif 's' in prob_steps[i].properties:
-                    prob_steps[i].probability = 1 - rp
-                elif 'e' in prob_steps[i].properties:
-                    prob_steps[i].probability = rp
-
-        return prob_steps
+    def probabilities(self, m: MorphInputs, rp) -> np.ndarray:
+        return np.select([m.both, m.base, m.extra], [np.maximum(1 - rp, rp), 1 - rp, rp], 0.0)
 
 
 class DirectMorph50(ProbStepAlg):
-    def generate_prob_steps(self, s: StepSequence, e: StepSequence, r: int) -> list[ProbStep]:
-        rp = np.clip(r/100, 0, 1)
-        data = [seq.sequence() for seq in (s, e) if seq.has_onset()]
-        length = np.lcm.reduce([len(item) for item in data])
-        prob_steps = []
-
-        # Adds and marks the probability steps that correspond to an onset from the inputted sequences
-        for i in range(length):
-            prob_steps.append(ProbStep())
-            for seq in data:
-                if seq[i % len(seq)].onset:
-                    prob_steps[i].onset = True
-                    if seq is s.sequence():
-                        prob_steps[i].properties.add('s')
-                    if seq is e.sequence():
-                        prob_steps[i].properties.add('e')
-
-        for i in range(length):
-            if prob_steps[i].onset:
-                if 's' in prob_steps[i].properties:
-                    prob_steps[i].probability = 1 - (rp/2)
-                elif 'e' in prob_steps[i].properties:
-                    prob_steps[i].probability = rp/2
-
-        return prob_steps
+    def probabilities(self, m: MorphInputs, rp) -> np.ndarray:
+        return np.select([m.base, m.extra], [1 - (rp/2), rp/2], 0.0)
 
 
+@register()
 class TestingNoRandom(ProbStepAlg):
-    def generate_prob_steps(self, s: StepSequence, e: StepSequence, r: int) -> list[ProbStep]:
-        rp = np.clip(r/100, 0, 1)
-        data = [seq.sequence() for seq in (s, e) if seq.has_onset()]
-        length = np.lcm.reduce([len(item) for item in data])
-        prob_steps = []
-
-        for i in range(length):
-            prob_steps.append(ProbStep())
-            for seq in data:
-                if seq[i % len(seq)].onset:
-                    prob_steps[i].onset = True
-                    prob_steps[i].probability = 1.00
-                    if seq is s.sequence():
-                        prob_steps[i].properties.add('s')
-                    if seq is e.sequence():
-                        prob_steps[i].properties.add('e')
-
-        return prob_steps
+    def probabilities(self, m: MorphInputs, rp) -> np.ndarray:
+        return np.where(m.onset, 1.00, 0.00)
@@ -0,0 +1,94 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from .probsteps import ProbStepArray
+
+# Bumped whenever the encoding of cached entries or the rendered output changes
+CACHE_VERSION = 1
+
+
+class RenderCache:
+    # Content-addressed cache of rendered MIDI files and probability tables on disk. Entries are
+    # written to a temporary file and renamed into place, so worker processes can share a cache
+    # directory and readers never see partial entries. Reads refresh an entry's modification time,
+    # and once the directory grows past max_bytes the least recently used entries are deleted.
+    def __init__(self, path: str, max_bytes: int = 1 << 30):
+        self._path = path
+        self._max_bytes = max_bytes
+        # Bytes written since the directory size was last checked, the size is only scanned again
+        # after a sixteenth of the limit has been written
+        self._written = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        data = json.dumps([CACHE_VERSION, *parts], sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self._path, key[:2], key)
+
+    def get(self, key: str) -> bytes | None:
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes):
+        path = self._file(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self._written += len(data)
+        if self._written * 16 >= self._max_bytes:
+            self.evict()
+
+    def evict(self):
+        self._written = 0
+        entries = []
+        for root, _, files in os.walk(self._path):
+            for name in files:
+                if name.startswith('.tmp-'):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        size = sum(entry[1] for entry in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= self._max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+
+    def prob_steps(self, key: str, compute) -> ProbStepArray:
+        # Returns the probability table stored under key, computing and storing it on a miss
+        data = self.get(key)
+        if data is not None:
+            with np.load(io.BytesIO(data)) as f:
+                return ProbStepArray(f['probability'], f['properties'], tuple(f['labels'].tolist()))
+        prob_steps = compute()
+        buffer = io.BytesIO()
+        np.savez(buffer, probability=prob_steps.probability, properties=prob_steps.properties,
+                 labels=np.array(prob_steps.labels, dtype=str))
+        self.put(key, buffer.getvalue())
+        return prob_steps
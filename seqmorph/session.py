@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from seq import StepSequence
+from midi import MidiWriter
+from .eucmorpher import EucMorpher
+from .probsteps import PeriodicProbSteps, morphers
+from .expression import Expression
+from .markov import MarkovMorpher
+
+# Steps generated per chunk of a hyperperiod above MAX_PERIOD, and of a GENERATE job in the controller where
+# progress and cancellation are checked between chunks
+CHUNK_STEPS = 1 << 14
+
+
+@dataclass
+class GenerateParams:
+    sequence: str = '1000100010001000'
+    onsets: int = 0
+    length: int = 16
+    rotation: int = 0
+    amount: int = 0
+    algorithm: str = 'DirectMorph100'
+    note: int = 48
+    tempo: int = 120
+    subdivision: int = 4
+    bars: int = 1
+    expression: Expression = None
+    # Conditions every bar on the bars before it, see MarkovMorpher
+    feedback: float = 0.0
+    feedback_rate: float = 0.5
+
+
+class Session:
+    # Generation state shared by consecutive GENERATE calls: the MIDI file being built and the
+    # position in the hyperperiod and the trace of feedback generation, which restart when the Euclidean
+    # rhythm or base rhythm changes
+    def __init__(self, seed=None, algorithms: dict = None):
+        self.morphers = morphers() if algorithms is None else algorithms
+        self.mw = MidiWriter()
+        self._rng = np.random.default_rng(seed)
+        self._old_euc_params = (-1, -1, -1)
+        self._old_seq = None
+        self._pos = 0
+        self._trace = None
+        self.morpher: EucMorpher = None
+        self.start_pos = 0
+
+    def position(self):
+        return self._pos
+
+    @staticmethod
+    def _base(params: GenerateParams) -> StepSequence:
+        return (StepSequence(tempo=params.tempo, subdivision=params.subdivision, note=params.note)
+                .init_from_list(list(int(x) for x in params.sequence)))
+
+    def _morpher(self, params: GenerateParams, s: StepSequence) -> EucMorpher:
+        return EucMorpher(s, params.onsets, params.length, params.rotation, params.amount,
+                          self.morphers[params.algorithm], seed=self._rng, expression=params.expression)
+
+    def bars_per_period(self, params: GenerateParams) -> int:
+        # Bars generated for a whole hyperperiod (bars=0) with these settings
+        return self._morpher(params, self._base(params)).hyperperiod_bars()
+
+    def _sample(self, generator: EucMorpher | MarkovMorpher, m: EucMorpher, bars: int) -> StepSequence:
+        if bars > 0 or not isinstance(m.prob_steps(), PeriodicProbSteps):
+            return generator.generate(bars, self._pos)
+        # A lazy hyperperiod is never generated in one piece, its bars are sampled in chunks and joined
+        total, chunk_bars = m.hyperperiod_bars(), max(1, CHUNK_STEPS // m.bar_length())
+        pos = self._pos
+        parts = []
+        for start in range(0, total, chunk_bars):
+            v = generator.generate(min(chunk_bars, total - start), pos)
+            pos = (pos + v.length()) % len(m.prob_steps())
+            parts.append(v)
+        return m.make_sequence(*(np.concatenate([getattr(v, name)() for v in parts])
+                                 for name in ('onsets', 'velocities', 'offsets')))
+
+    def generate(self, params: GenerateParams) -> StepSequence:
+        k, n, r = params.onsets, params.length, params.rotation
+        s = self._base(params)
+        m = self._morpher(params, s)
+
+        if self._old_euc_params != (k, n, r) or not s.is_same_rhythm(self._old_seq):
+            self._pos = 0
+            self._trace = None
+
+        self.start_pos = self._pos
+        if params.feedback:
+            markov = MarkovMorpher(m, params.feedback, params.feedback_rate, self._trace)
+            v = self._sample(markov, m, params.bars)
+            self._trace = markov.trace()
+        else:
+            v = self._sample(m, m, params.bars)
+        self._pos = (self._pos + v.length()) % len(m.prob_steps())
+
+        self.mw.add(v)
+
+        self._old_euc_params = (k, n, r)
+        self._old_seq = s
+        self.morpher = m
+        return v
+
+    def save(self, path: str):
+        self.mw.save(path)
+        self.mw = MidiWriter()
+
+    def clear(self):
+        self.mw = MidiWriter()
+        self._trace = None
@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+
+from .probsteps import ProbStepArray, PeriodicProbSteps, S, E
+
+# Exact statistics of generated bars, computed from the step probabilities instead of sampling.
+# Steps are sampled independently, so every bar is a sequence of Bernoulli trials.
+
+
+def onset_count_distribution(p: np.ndarray) -> np.ndarray:
+    # Poisson-binomial distribution of the number of onsets over the last axis, P(k onsets) for
+    # k = 0..steps. The polynomials 1 - p + p z of the steps are multiplied pairwise with FFT
+    # convolutions, O(n log^2 n) time and O(n) memory per bar.
+    p = np.asarray(p, dtype=np.float64)
+    steps = p.shape[-1]
+    polys = np.stack((1 - p, p), axis=-1)
+    while polys.shape[-2] > 1:
+        if polys.shape[-2] % 2:
+            # Pads with the polynomial 1 so every polynomial has a partner
+            one = np.zeros(polys.shape[:-2] + (1, polys.shape[-1]))
+            one[..., 0] = 1
+            polys = np.concatenate((polys, one), axis=-2)
+        n = 2 * polys.shape[-1] - 1
+        f = np.fft.rfft(polys, n, axis=-1)
+        polys = np.fft.irfft(f[..., 0::2, :] * f[..., 1::2, :], n, axis=-1)
+    if steps == 0:
+        return np.ones(p.shape[:-1] + (1,))
+    return np.clip(polys[..., 0, :steps + 1], 0, 1)
+
+
+def pattern_probability(p: np.ndarray, pattern: np.ndarray) -> np.ndarray:
+    # Probability that the sampled steps equal pattern exactly, over the last axis
+    with np.errstate(divide='ignore'):
+        log = np.log(np.where(pattern, p, 1 - p)).sum(axis=-1)
+    return np.exp(log)
+
+
+@dataclass(eq=False)
+class MorphStats:
+    # Step probabilities and S/E markings of the bars, both of shape (bars, steps)
+    probability: np.ndarray
+    properties: np.ndarray
+
+    @cached_property
+    def expected_onsets(self) -> np.ndarray:
+        return self.probability.sum(axis=-1)
+
+    @cached_property
+    def variance(self) -> np.ndarray:
+        # Variance of each step's onset
+        return self.probability * (1 - self.probability)
+
+    @cached_property
+    def onset_variance(self) -> np.ndarray:
+        # Variance of the number of onsets of each bar
+        return self.variance.sum(axis=-1)
+
+    @cached_property
+    def base_probability(self) -> np.ndarray:
+        # Probability that each bar is generated exactly as the base rhythm
+        return pattern_probability(self.probability, (self.properties & S) != 0)
+
+    @cached_property
+    def euclidean_probability(self) -> np.ndarray:
+        return pattern_probability(self.probability, (self.properties & E) != 0)
+
+    @cached_property
+    def onset_counts(self) -> np.ndarray:
+        return onset_count_distribution(self.probability)
+
+
+def bar_statistics(prob_steps: ProbStepArray | PeriodicProbSteps, bar_length: int, num_bars: int = None,
+                   start: int = 0) -> MorphStats:
+    # Statistics of num_bars bars from start, or of every bar of the hyperperiod if num_bars is None
+    if num_bars is None or num_bars <= 0:
+        num_bars = -(-len(prob_steps) // bar_length)
+    length = num_bars * bar_length
+    return MorphStats(prob_steps.window(start, length).reshape(num_bars, bar_length),
+                      prob_steps.properties_window(start, length).reshape(num_bars, bar_length))